@@ -0,0 +1,10 @@
+#!/bin/sh
+# Migrates and loads the data into the configured database on start, so the
+# load runs against PostgreSQL under docker-compose. add_initial_data skips
+# the load when the database already holds the data.
+set -e
+
+python manage.py migrate portfolioviz
+python manage.py add_initial_data
+
+exec "$@"
@@ -6,4 +6,4 @@ class PortfolioVizConfig(AppConfig):
     name = 'portfolioviz'
     
     def ready(self):
-        pass
+        from portfolioviz import signals
@@ -0,0 +1,263 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+from django.core.cache import caches
+from django.db.models import Count
+from portfolioviz.models import Price, Quantity
+from portfolioviz.settings import (
+  MATRIX_CACHE_MAX_BYTES,
+  TIME_SERIES_CACHE_ALIAS,
+  TIME_SERIES_VERSION_CACHE_ALIAS,
+)
+from portfolioviz.utils import Singleton, date_range
+
+DATA_VERSION_KEY = 'portfolioviz:data_version'
+
+PRICES_KEY = 'prices'
+
+
+class TimeSeriesCache(metaclass=Singleton):
+  
+  def __init__(
+      self,
+      alias: str = TIME_SERIES_CACHE_ALIAS,
+      version_alias: str = TIME_SERIES_VERSION_CACHE_ALIAS) -> None:
+    self.alias = alias
+    self.version_alias = version_alias
+  
+  @property
+  def cache(self):
+    return caches[self.alias]
+  
+  @property
+  def version_cache(self):
+    return caches[self.version_alias]
+  
+  def data_version(self) -> int:
+    ## A fresh timestamp instead of a counter, so an evicted version key can
+    ## never make entries written under an older version visible again
+    return self.version_cache.get_or_set(DATA_VERSION_KEY, time.time_ns(), None)
+  
+  def invalidate(self) -> None:
+    self.version_cache.set(DATA_VERSION_KEY, time.time_ns(), None)
+  
+  def key(self, name: str, portfolio_id, date_from: date, date_to: date) -> str:
+    date_from, date_to = date_range(date_from, date_to)
+    return ':'.join([
+      'portfolioviz',
+      name,
+      str(self.data_version()),
+      str(portfolio_id),
+      date_from.isoformat(),
+      date_to.isoformat()])
+  
+  def get_or_compute(
+      self,
+      name: str,
+      portfolio_id,
+      date_from: date,
+      date_to: date,
+      compute: Callable):
+    key = self.key(name, portfolio_id, date_from, date_to)
+    cached = self.cache.get(key)
+    if cached is None:
+      cached = compute()
+      self.cache.set(key, cached)
+    return cached
+
+
+timeSeriesCache = TimeSeriesCache()
+
+
+@dataclass
+class SeriesMatrix:
+  ## Dense date x asset amounts, with dates sorted for binary search
+  dates: np.ndarray
+  asset_ids: np.ndarray
+  values: np.ndarray
+  columns: Dict[int, int] = field(init=False, repr=False)
+  
+  def __post_init__(self) -> None:
+    self.columns = {
+      asset_id: column for column, asset_id in enumerate(self.asset_ids.tolist())}
+  
+  @classmethod
+  def from_rows(cls, rows: Iterable) -> 'SeriesMatrix':
+    ## rows of (date, asset_id, amount)
+    frame = pd.DataFrame(
+      list(rows), columns=['date', 'asset_id', 'amount']).pivot(
+      index='date', columns='asset_id', values='amount').sort_index()
+    return cls(
+      np.array(frame.index.tolist(), dtype='datetime64[D]'),
+      frame.columns.to_numpy(dtype=np.int64),
+      frame.to_numpy(dtype=np.float64))
+  
+  @property
+  def nbytes(self) -> int:
+    return self.dates.nbytes + self.asset_ids.nbytes + self.values.nbytes
+  
+  def get(self, asset_id: int, dt_date: date) -> Optional[float]:
+    row = self.row(dt_date)
+    column = self.columns.get(asset_id)
+    if row is None or column is None or np.isnan(self.values[row, column]):
+      return None
+    return float(self.values[row, column])
+  
+  def row(self, dt_date: date) -> Optional[int]:
+    day = np.datetime64(dt_date, 'D')
+    row = int(np.searchsorted(self.dates, day))
+    if row == len(self.dates) or self.dates[row] != day:
+      return None
+    return row
+  
+  def rows_between(self, date_from: date, date_to: date) -> slice:
+    date_from, date_to = date_range(date_from, date_to)
+    return slice(
+      int(np.searchsorted(self.dates, np.datetime64(date_from, 'D'))),
+      int(np.searchsorted(
+        self.dates, np.datetime64(date_to, 'D'), side='right')))
+
+
+class MatrixCache(metaclass=Singleton):
+  ## Read-through cache of price and per portfolio quantity matrices, kept
+  ## in process memory and evicted least recently used first once their
+  ## size goes over max_bytes. Any write that bumps the time series data
+  ## version drops every matrix. Matrices that could never be kept are
+  ## told apart by fits, so that their reads go to the database instead.
+  
+  def __init__(
+      self,
+      max_bytes: int = MATRIX_CACHE_MAX_BYTES,
+      time_series_cache: TimeSeriesCache = timeSeriesCache) -> None:
+    self.max_bytes = max_bytes
+    self.time_series_cache = time_series_cache
+    self.entries: OrderedDict = OrderedDict()
+    self.nbytes = 0
+    self.sizes: Dict[Hashable, int] = {}
+    self.version = None
+    self.lock = threading.RLock()
+  
+  def prices(self) -> SeriesMatrix:
+    return self.get_or_load(PRICES_KEY, lambda: SeriesMatrix.from_rows(
+      Price.objects.values_list('date', 'asset_id', 'amount')))
+  
+  def quantities(self, portfolio_id: int) -> SeriesMatrix:
+    return self.get_or_load(
+      ('quantities', portfolio_id),
+      lambda: SeriesMatrix.from_rows(
+        Quantity.objects.filter(portfolio_id=portfolio_id).values_list(
+          'date', 'asset_id', 'amount')))
+  
+  def price(self, asset_id: int, dt_date: date) -> Optional[float]:
+    return self.prices().get(asset_id, dt_date)
+  
+  def quantity(
+      self,
+      portfolio_id: int,
+      asset_id: int,
+      dt_date: date) -> Optional[float]:
+    return self.quantities(portfolio_id).get(asset_id, dt_date)
+  
+  def shares(
+      self,
+      portfolio_id: int,
+      date_from: date,
+      date_to: date) -> pd.DataFrame:
+    ## Price times quantity, shaped like PortfolioSelector.share_frame
+    quantities = self.quantities(portfolio_id)
+    prices = self.prices()
+    rows = quantities.rows_between(date_from, date_to)
+    dates = quantities.dates[rows]
+    shares = np.full((len(dates), len(quantities.asset_ids)), np.nan)
+    if len(dates) and len(prices.dates):
+      price_rows = np.minimum(
+        np.searchsorted(prices.dates, dates), len(prices.dates) - 1)
+      price_columns = np.array([
+        prices.columns.get(asset_id, -1)
+        for asset_id in quantities.asset_ids.tolist()], dtype=np.int64)
+      aligned = prices.values[np.ix_(price_rows, price_columns)]
+      aligned[prices.dates[price_rows] != dates] = np.nan
+      aligned[:, price_columns < 0] = np.nan
+      shares = quantities.values[rows] * aligned
+    return pd.DataFrame(
+      shares,
+      index=pd.Index(dates.astype(object), name='date'),
+      columns=pd.Index(quantities.asset_ids, name='asset_id'))
+  
+  def fits(self, portfolio_ids: Iterable[int] = ()) -> bool:
+    version = self.time_series_cache.data_version()
+    estimates = [(PRICES_KEY, Price.objects.all())] + [
+      (('quantities', portfolio_id),
+       Quantity.objects.filter(portfolio_id=portfolio_id))
+      for portfolio_id in portfolio_ids]
+    return all(
+      self.estimated_nbytes(version, key, rows) <= self.max_bytes
+      for key, rows in estimates)
+  
+  def estimated_nbytes(self, version, key: Hashable, rows) -> int:
+    ## Size of the dense matrix the rows pivot into, from one count query per
+    ## key and data version
+    with self.lock:
+      self.sync(version)
+      matrix = self.entries.get(key)
+      if matrix is not None:
+        return matrix.nbytes
+      nbytes = self.sizes.get(key)
+    if nbytes is None:
+      counts = rows.aggregate(
+        dates=Count('date', distinct=True),
+        assets=Count('asset_id', distinct=True))
+      nbytes = 8 * (
+        counts['dates'] + counts['assets'] + counts['dates'] * counts['assets'])
+      with self.lock:
+        if version == self.version:
+          self.sizes[key] = nbytes
+    return nbytes
+  
+  def warm(self, portfolio_ids: List[int]) -> None:
+    self.prices()
+    for portfolio_id in portfolio_ids:
+      self.quantities(portfolio_id)
+  
+  def invalidate(self) -> None:
+    with self.lock:
+      self.entries.clear()
+      self.sizes.clear()
+      self.nbytes = 0
+  
+  def sync(self, version) -> None:
+    if version != self.version:
+      self.invalidate()
+      self.version = version
+  
+  def get_or_load(self, key: Hashable, load: Callable) -> SeriesMatrix:
+    version = self.time_series_cache.data_version()
+    with self.lock:
+      self.sync(version)
+      matrix = self.entries.get(key)
+      if matrix is not None:
+        self.entries.move_to_end(key)
+        return matrix
+    matrix = load()
+    with self.lock:
+      if version == self.version and matrix.nbytes <= self.max_bytes:
+        self.store(key, matrix)
+    return matrix
+  
+  def store(self, key: Hashable, matrix: SeriesMatrix) -> None:
+    previous = self.entries.pop(key, None)
+    if previous is not None:
+      self.nbytes -= previous.nbytes
+    self.entries[key] = matrix
+    self.nbytes += matrix.nbytes
+    while self.nbytes > self.max_bytes:
+      _, evicted = self.entries.popitem(last=False)
+      self.nbytes -= evicted.nbytes
+
+
+matrixCache = MatrixCache()
@@ -3,4 +3,72 @@ from datetime import datetime
 
 INITIAL_DATE = datetime.strptime("2022-02-14", DATE_FORMAT).date()
 
-INITIAL_VALUE = 1_000_000_000
\ No newline at end of file
+INITIAL_VALUE = 1_000_000_000
+
+WEIGHTS_SUM_TOLERANCE = 1e-6
+
+BULK_CREATE_BATCH_SIZE = 5_000
+
+LOAD_CHUNK_SIZE = 250
+
+SOURCE_CHUNK_ROWS = 10_000
+
+ROW_STORAGE = 'rows'
+
+COLUMNAR_STORAGE = 'columnar'
+
+DERIVED_STORAGE = 'derived'
+
+DECIMAL_NUMERIC = 'decimal'
+
+FLOAT_NUMERIC = 'float'
+
+PRICES_SHEET_NAME = 'Precios'
+
+WEIGHTS_SHEET_NAME = 'weights'
+
+DAILY_RESOLUTION = 'day'
+
+WEEKLY_RESOLUTION = 'week'
+
+MONTHLY_RESOLUTION = 'month'
+
+ROLLUP_FREQUENCIES = {WEEKLY_RESOLUTION: 'W', MONTHLY_RESOLUTION: 'M'}
+
+ROWS_RESPONSE_FORMAT = 'rows'
+
+COLUMNS_RESPONSE_FORMAT = 'columns'
+
+RESPONSE_FORMATS = [ROWS_RESPONSE_FORMAT, COLUMNS_RESPONSE_FORMAT]
+
+VALUE_METRIC = 'value'
+
+WEIGHTS_METRIC = 'weights'
+
+SERIES_METRICS = [VALUE_METRIC, WEIGHTS_METRIC]
+
+TRADING_DAYS = 252
+
+ASSET_COVARIANCE = 'asset'
+
+PORTFOLIO_COVARIANCE = 'portfolio'
+
+COVARIANCE_KINDS = [ASSET_COVARIANCE, PORTFOLIO_COVARIANCE]
+
+COVARIANCE_WINDOW = TRADING_DAYS
+
+COVARIANCE_METRIC = 'covariance'
+
+CORRELATION_METRIC = 'correlation'
+
+COVARIANCE_METRICS = [COVARIANCE_METRIC, CORRELATION_METRIC]
+
+STREAM_CHUNK_SIZE = 2_000
+
+STREAM_RESPONSE_ROWS = 100
+
+JSON_STREAM = 'json'
+
+NDJSON_STREAM = 'ndjson'
+
+STREAM_FORMATS = [JSON_STREAM, NDJSON_STREAM]
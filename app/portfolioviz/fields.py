@@ -0,0 +1,39 @@
+from django.db import models
+from portfolioviz.constants import FLOAT_NUMERIC
+from portfolioviz.settings import TIME_SERIES_NUMERIC
+
+
+def stores_floats() -> bool:
+    return TIME_SERIES_NUMERIC == FLOAT_NUMERIC
+
+
+class DerivedAmountField(models.DecimalField):
+    ## Shares, weights and values are computed in float64 anyway, so the
+    ## float mode reads and writes them as computed. Migrations always see a
+    ## numeric(max_digits, decimal_places) column, whatever the mode, and
+    ## convert_time_series_numeric changes its type on the database.
+    
+    def get_internal_type(self):
+        ## Keeps the backends from rounding floats into Decimals
+        if stores_floats():
+            return 'FloatField'
+        return super().get_internal_type()
+    
+    def db_type(self, connection):
+        return connection.data_types['DecimalField'] % (
+            self.db_type_parameters(connection))
+    
+    def to_python(self, value):
+        if stores_floats() and value is not None:
+            return float(value)
+        return super().to_python(value)
+    
+    def get_db_prep_save(self, value, connection):
+        if stores_floats():
+            return self.get_db_prep_value(value, connection)
+        return super().get_db_prep_save(value, connection)
+    
+    def from_db_value(self, value, expression, connection):
+        if stores_floats() and value is not None:
+            return float(value)
+        return value
@@ -1,6 +1,13 @@
-from django.core.management.base import BaseCommand
+import json
+from django.core.management.base import BaseCommand, CommandError
+from portfolioviz.constants import (
+    BULK_CREATE_BATCH_SIZE,
+    LOAD_CHUNK_SIZE
+)
 from portfolioviz.models import Portfolio
+from portfolioviz.profiling import LoadProfiler
 from portfolioviz.services import dataExtractor, entityLoader
+from portfolioviz.utils import positive_int
 
 
 class Command(BaseCommand):
@@ -11,13 +18,63 @@ class Command(BaseCommand):
         self.data_extractor = dataExtractor
         self.entity_loader = entityLoader
     
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=positive_int,
+            default=BULK_CREATE_BATCH_SIZE,
+            help='Rows per bulk insert statement')
+        parser.add_argument(
+            '--chunk-size',
+            type=positive_int,
+            default=LOAD_CHUNK_SIZE,
+            help='Dates computed and written per chunk')
+        parser.add_argument(
+            '--append',
+            action='store_true',
+            help='Load only the dates after the last loaded one')
+        parser.add_argument(
+            '--profile',
+            action='store_true',
+            help='Print a JSON report of time, rows, queries and peak '
+                 'memory per load stage')
+        parser.add_argument(
+            '--cprofile-dir',
+            help='Dump one cProfile stats file per load stage here')
+    
     def dataExists(self):
         return Portfolio.objects.exists()
     
     def handle(self, *args, **options):
+        profiler = LoadProfiler(
+            enabled=options['profile'] or bool(options['cprofile_dir']),
+            cprofile=bool(options['cprofile_dir']))
+        self.entity_loader.profiler = profiler
+        
         if not self.dataExists():
-            extracted_data = self.data_extractor.extract_data()
+            with profiler.stage('extract_data'):
+                extracted_data = self.data_extractor.extract_data()
+            
+            self.entity_loader.populate_db(
+                extracted_data,
+                options['batch_size'],
+                options['chunk_size'])
+        elif options['append']:
+            with profiler.stage('extract_data'):
+                extracted_data = self.data_extractor.extract_data()
             
-            self.entity_loader.populate_db(extracted_data)
+            try:
+                self.entity_loader.append(
+                    extracted_data,
+                    options['batch_size'],
+                    options['chunk_size'])
+            except ValueError as error:
+                raise CommandError(error)
         else:
-            self.stdout.write('Initial data already exists')
\ No newline at end of file
+            self.stdout.write('Initial data already exists')
+            return
+        
+        if options['profile']:
+            self.stdout.write(json.dumps(profiler.report(), indent=2))
+        if options['cprofile_dir']:
+            profiler.dump_stats(options['cprofile_dir'])
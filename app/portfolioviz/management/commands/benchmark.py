@@ -0,0 +1,171 @@
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+import orjson
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from portfolioviz.cache import timeSeriesCache
+from portfolioviz.settings import TIME_SERIES_NUMERIC
+from portfolioviz.utils import json_dumps
+from portfolioviz.models import Portfolio, PortfolioValue, Share, Weight
+from portfolioviz.services import (
+    DataExtractor,
+    SyntheticDataExtractor,
+    entityLoader
+)
+
+DEFAULT_SIZES = ['20x2x250', '100x5x500', '500x5x750']
+
+
+class Command(BaseCommand):
+    help = ('Times data extraction, populate_db, serialization and the '
+            'value/weights and simulation endpoints on generated datasets of increasing size, '
+            'using a throwaway test database, and measures its size. Sizes '
+            'are ASSETSxPORTFOLIOSxDATES. Run it once per '
+            'PORTFOLIOVIZ_TIME_SERIES_NUMERIC mode and compare the outputs '
+            'with --baseline.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--output',
+            help='Write the results as JSON to this file')
+        parser.add_argument(
+            '--baseline',
+            help='JSON results of a previous run to compare against')
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=1.2,
+            help='Fail when a timing exceeds the baseline by this factor')
+        parser.add_argument(
+            '--size-threshold',
+            type=float,
+            default=1.1,
+            help='Fail when a size in bytes exceeds the baseline by this '
+                 'factor')
+    
+    def handle(self, *args, **options):
+        old_database_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = {
+                size: self.benchmark_size(size, options['repeat'])
+                for size in options['sizes']}
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+        
+        self.stdout.write(f'Numeric mode: {TIME_SERIES_NUMERIC}')
+        self.stdout.write(json.dumps(results, indent=2))
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2)
+        if options['baseline']:
+            self.check_regressions(
+                results,
+                options['baseline'],
+                options['threshold'],
+                options['size_threshold'])
+    
+    def benchmark_size(self, size, repeat):
+        assets_count, portfolios_count, dates_count = map(int, size.split('x'))
+        raw_data = SyntheticDataExtractor(
+            assets_count, portfolios_count, dates_count).extract_data()
+        timings = {}
+        
+        with tempfile.TemporaryDirectory() as directory:
+            data_path = Path(directory) / 'datos'
+            data_path.mkdir()
+            raw_data.prices.to_csv(data_path / 'Precios.csv')
+            raw_data.initial_weights.to_csv(data_path / 'weights.csv')
+            extractor = DataExtractor(data_path, Path(directory) / 'cache')
+            timings['extract_data'] = self.timed(extractor.extract_data)
+            timings['extract_data_cached'] = self.timed(extractor.extract_data)
+        
+        call_command('flush', interactive=False, verbosity=0)
+        timings['populate_db'] = self.timed(
+            lambda: entityLoader.populate_db(raw_data))
+        timings['database_bytes'] = self.database_bytes()
+        
+        client = Client(HTTP_HOST='localhost')
+        portfolio = Portfolio.objects.order_by('id').first()
+        for model in [Share, Weight, PortfolioValue]:
+            rows = model.objects.filter(portfolio=portfolio)
+            timings[f'serialize_{model._meta.model_name}'] = statistics.median(
+                self.timed(lambda: json_dumps(
+                    list(rows.values('date', 'amount'))))
+                for _ in range(repeat))
+        for endpoint in ['value', 'weights']:
+            url = f'/portfolio/{portfolio.id}/{endpoint}'
+            timings[f'{endpoint}_endpoint'] = statistics.median(
+                self.timed(lambda: self.uncached_get(client, url))
+                for _ in range(repeat))
+        simulation = orjson.dumps({
+            'weights': raw_data.initial_weights.droplevel('Fecha')
+            .reset_index().to_dict('records'),
+            'format': 'columns'})
+        timings['simulate_endpoint'] = statistics.median(
+            self.timed(lambda: self.simulate(client, simulation))
+            for _ in range(repeat))
+        return timings
+    
+    def uncached_get(self, client, url):
+        caches[timeSeriesCache.alias].clear()
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f'{url} answered {response.status_code}')
+    
+    def simulate(self, client, payload):
+        response = client.post(
+            '/portfolios/simulate', payload, content_type='application/json')
+        if response.status_code != 200:
+            raise CommandError(f'Simulation answered {response.status_code}')
+    
+    def database_bytes(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_database_size(current_database())')
+                return cursor.fetchone()[0]
+            cursor.execute('PRAGMA page_count')
+            page_count = cursor.fetchone()[0]
+            cursor.execute('PRAGMA page_size')
+            return page_count * cursor.fetchone()[0]
+    
+    def timed(self, function):
+        start = time.perf_counter()
+        function()
+        return time.perf_counter() - start
+    
+    def check_regressions(
+            self, results, baseline_path, threshold, size_threshold):
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        compared = [
+            (size, name, measured, baseline[size][name])
+            for size, timings in results.items() if size in baseline
+            for name, measured in timings.items()
+            if name in baseline[size]]
+        regressions = []
+        for size, name, measured, baseline_measured in compared:
+            ## Sizes are bytes and get their own threshold, the rest seconds
+            if name.endswith('_bytes'):
+                measure, limit = '{:.0f}B', size_threshold
+            else:
+                measure, limit = '{:.4f}s', threshold
+            self.stdout.write(
+                f'{size} {name}: {measure.format(measured)} vs '
+                f'{measure.format(baseline_measured)} '
+                f'({measured / baseline_measured:.2f}x)')
+            if measured > limit * baseline_measured:
+                regressions.append(
+                    f'{size} {name}: {measure.format(measured)} > '
+                    f'{limit} x {measure.format(baseline_measured)}')
+        if regressions:
+            raise CommandError('Regressions found:\n' + '\n'.join(regressions))
+        self.stdout.write('No regressions against the baseline')
@@ -0,0 +1,88 @@
+import statistics
+import time
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from portfolioviz.models import (
+    Asset,
+    Portfolio,
+    PortfolioValue,
+    Price,
+    Quantity,
+    Share,
+    Weight
+)
+from portfolioviz.services import SyntheticDataExtractor, entityLoader
+
+MIGRATION_WITHOUT_INDEXES = '0001_initial'
+
+
+class Command(BaseCommand):
+    help = ('Compares time series query plans and latencies with and without '
+            'the composite indexes on a generated dataset, using a throwaway '
+            'test database.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--assets', type=int, default=100)
+        parser.add_argument('--portfolios', type=int, default=5)
+        parser.add_argument('--dates', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=20)
+    
+    def handle(self, *args, **options):
+        old_database_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            raw_data = SyntheticDataExtractor(
+                options['assets'],
+                options['portfolios'],
+                options['dates']).extract_data()
+            entityLoader.populate_db(raw_data)
+            self.stdout.write(
+                f'{Weight.objects.count()} weights, '
+                f'{Price.objects.count()} prices loaded')
+            
+            queries = self.sample_queries()
+            call_command(
+                'migrate', 'portfolioviz', MIGRATION_WITHOUT_INDEXES, verbosity=0)
+            self.report('Without composite indexes', queries, options['repeat'])
+            call_command('migrate', 'portfolioviz', verbosity=0)
+            self.report('With composite indexes', queries, options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+    
+    def sample_queries(self):
+        portfolio = Portfolio.objects.order_by('id')[
+            Portfolio.objects.count() // 2]
+        asset = Asset.objects.order_by('id')[Asset.objects.count() // 2]
+        dates = list(Price.objects.filter(asset=asset).order_by(
+            'date').values_list('date', flat=True))
+        date = dates[len(dates) // 2]
+        date_range = [dates[len(dates) // 4], dates[3 * len(dates) // 4]]
+        
+        return {
+            'price_get': Price.objects.filter(asset=asset, date=date),
+            'quantity_get': Quantity.objects.filter(
+                portfolio=portfolio, asset=asset, date=date),
+            'share_get': Share.objects.filter(
+                portfolio=portfolio, asset=asset, date=date),
+            'portfolio_value_get': PortfolioValue.objects.filter(
+                portfolio=portfolio, date=date),
+            'portfolio_value_list': PortfolioValue.objects.filter(
+                portfolio=portfolio, date__range=date_range),
+            'weight_list': Weight.objects.filter(
+                portfolio=portfolio, date__range=date_range),
+            'prices_since': Price.objects.filter(date__gte=date_range[1]),
+        }
+    
+    def report(self, title, queries, repeat):
+        self.stdout.write(f'\n{title}')
+        for name, queryset in queries.items():
+            latencies = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                latencies.append(time.perf_counter() - start)
+            plan = ' | '.join(queryset.explain().splitlines())
+            self.stdout.write(
+                f'  {name:<22}{1000 * statistics.median(latencies):>10.3f} ms'
+                f'  {plan}')
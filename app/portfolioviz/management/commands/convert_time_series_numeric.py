@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from portfolioviz.constants import FLOAT_NUMERIC
+from portfolioviz.models import PortfolioValue, Share, Weight
+from portfolioviz.settings import TIME_SERIES_NUMERIC
+
+
+class Command(BaseCommand):
+    help = ('Changes the column type of the Share, Weight and PortfolioValue '
+            'amounts to the PORTFOLIOVIZ_TIME_SERIES_NUMERIC mode: double '
+            'precision in float mode, numeric(40, 6) in decimal mode. '
+            'Migrations always create numeric columns, so run it again after '
+            'migrating a database in float mode.')
+    
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            ## SQLite stores both modes as REAL, only the Python side differs
+            self.stdout.write('SQLite columns already hold both modes')
+            return
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in [Share, Weight, PortfolioValue]:
+                field = model._meta.get_field('amount')
+                column_type = (
+                    connection.data_types['FloatField']
+                    if TIME_SERIES_NUMERIC == FLOAT_NUMERIC
+                    else field.db_type(connection))
+                column = connection.ops.quote_name(field.column)
+                cursor.execute(
+                    f'ALTER TABLE '
+                    f'{connection.ops.quote_name(model._meta.db_table)} '
+                    f'ALTER COLUMN {column} TYPE {column_type} '
+                    f'USING {column}::{column_type}')
+                self.stdout.write(
+                    f'{model._meta.db_table}.{field.column}: {column_type}')
@@ -0,0 +1,83 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+from pathlib import Path
+from urllib.error import URLError
+from urllib.request import urlopen
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = [
+    '/portfolios/',
+    '/assets/',
+    '/portfolio/1/value',
+    '/portfolio/1/weights']
+
+
+class Command(BaseCommand):
+    help = ('Sends concurrent GET requests to running servers and reports '
+            'throughput and latency percentiles for each of them. Point one '
+            '--target at a server with sync views and another at one with '
+            'async views to compare both modes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target',
+            nargs='+',
+            default=['default=http://localhost:8000'],
+            help='NAME=BASE_URL of each server to load')
+        parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument(
+            '--output',
+            help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        results = {}
+        for target in options['target']:
+            name, _, base_url = target.partition('=')
+            if not base_url:
+                raise CommandError(f"Expected NAME=BASE_URL, got {target}")
+            results[name] = self.load(
+                base_url.rstrip('/'),
+                options['paths'],
+                options['concurrency'],
+                options['requests'],
+                options['timeout'])
+
+        report = json.dumps(results, indent=2)
+        self.stdout.write(report)
+        if options['output']:
+            Path(options['output']).write_text(report)
+
+    def load(self, base_url, paths, concurrency, requests, timeout):
+        urls = list(islice(
+            cycle(base_url + path for path in paths), requests))
+        send = lambda url: self.request(url, timeout)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            ## Warm up the server and its time series cache first
+            list(executor.map(send, urls[:concurrency]))
+            started = time.perf_counter()
+            timings = list(executor.map(send, urls))
+            elapsed = time.perf_counter() - started
+
+        latencies = [latency for latency, ok in timings if ok]
+        return {
+            'requests': len(timings),
+            'errors': len(timings) - len(latencies),
+            'throughput': len(timings) / elapsed,
+            'p50': float(np.percentile(latencies, 50)) if latencies else None,
+            'p99': float(np.percentile(latencies, 99)) if latencies else None}
+
+    def request(self, url, timeout):
+        started = time.perf_counter()
+        try:
+            with urlopen(url, timeout=timeout) as response:
+                response.read()
+            ok = True
+        except (URLError, OSError):
+            ok = False
+        return time.perf_counter() - started, ok
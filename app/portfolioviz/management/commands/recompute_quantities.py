@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from portfolioviz.constants import (
+    BULK_CREATE_BATCH_SIZE,
+    LOAD_CHUNK_SIZE
+)
+from portfolioviz.services import entityLoader
+from portfolioviz.utils import parse_request_date, positive_int
+
+
+class Command(BaseCommand):
+    help = ('Recomputes quantities, shares, values and weights from a date on, '
+            'applying the stored quantity transactions')
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from',
+            dest='from_date',
+            required=True,
+            help='Earliest changed transaction date, as YYYY-MM-DD')
+        parser.add_argument(
+            '--portfolio',
+            dest='portfolios',
+            action='append',
+            help='Portfolio name to recompute, all of them by default')
+        parser.add_argument(
+            '--batch-size', type=positive_int, default=BULK_CREATE_BATCH_SIZE)
+        parser.add_argument(
+            '--chunk-size', type=positive_int, default=LOAD_CHUNK_SIZE)
+    
+    def handle(self, *args, **options):
+        entityLoader.recompute_from(
+            parse_request_date(options['from_date']),
+            options['portfolios'],
+            options['batch_size'],
+            options['chunk_size'])
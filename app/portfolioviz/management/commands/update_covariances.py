@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from portfolioviz.constants import COVARIANCE_KINDS, COVARIANCE_WINDOW
+from portfolioviz.services import covarianceLoader
+
+
+class Command(BaseCommand):
+    help = ('Updates the stored covariance matrices of asset and portfolio '
+            'returns with the dates appended since their last update')
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            dest='kinds',
+            action='append',
+            choices=COVARIANCE_KINDS,
+            help='Kind of matrix to update, all of them by default')
+        parser.add_argument(
+            '--window',
+            dest='windows',
+            action='append',
+            type=int,
+            help=f'Rolling window in dates, {COVARIANCE_WINDOW} by default')
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Compute the windows from scratch instead of sliding them')
+    
+    def handle(self, *args, **options):
+        for kind in options['kinds'] or COVARIANCE_KINDS:
+            for window in options['windows'] or [COVARIANCE_WINDOW]:
+                covarianceLoader.update(kind, window, options['full'])
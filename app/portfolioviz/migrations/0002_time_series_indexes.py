@@ -0,0 +1,53 @@
+# Generated by Django 4.1.8 on 2026-10-18 16:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfolioviz", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="weight",
+            index=models.Index(
+                fields=["portfolio", "date"], name="weight_portfolio_date_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="portfoliovalue",
+            constraint=models.UniqueConstraint(
+                fields=("portfolio", "date"),
+                name="portfoliovalue_portfolio_date_unique",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="price",
+            constraint=models.UniqueConstraint(
+                fields=("asset", "date"), name="price_asset_date_unique"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="quantity",
+            constraint=models.UniqueConstraint(
+                fields=("portfolio", "asset", "date"),
+                name="quantity_portfolio_asset_date_unique",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="share",
+            constraint=models.UniqueConstraint(
+                fields=("portfolio", "asset", "date"),
+                name="share_portfolio_asset_date_unique",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="weight",
+            constraint=models.UniqueConstraint(
+                fields=("portfolio", "asset", "date"),
+                name="weight_portfolio_asset_date_unique",
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.1.8 on 2026-10-18 16:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfolioviz", "0002_time_series_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PortfolioSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("value", models.DecimalField(decimal_places=6, max_digits=40)),
+                ("shares", models.BinaryField()),
+                ("weights", models.BinaryField()),
+                (
+                    "portfolio",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="portfolioviz.portfolio",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="portfoliosnapshot",
+            constraint=models.UniqueConstraint(
+                fields=("portfolio", "date"),
+                name="portfoliosnapshot_portfolio_date_unique",
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.8 on 2026-10-18 16:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfolioviz", "0003_portfolio_snapshot"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="quantitytransaction",
+            index=models.Index(
+                fields=["portfolio", "date"], name="transaction_portfolio_date_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 4.1.8 on 2026-10-18 16:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfolioviz", "0004_quantity_transaction_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WeightRollup",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("resolution", models.CharField(max_length=10)),
+                ("date", models.DateField()),
+                ("amount", models.DecimalField(decimal_places=6, max_digits=40)),
+                (
+                    "asset",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="portfolioviz.asset",
+                    ),
+                ),
+                (
+                    "portfolio",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="portfolioviz.portfolio",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="PortfolioValueRollup",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("resolution", models.CharField(max_length=10)),
+                ("date", models.DateField()),
+                ("last", models.DecimalField(decimal_places=6, max_digits=40)),
+                ("mean", models.DecimalField(decimal_places=6, max_digits=40)),
+                ("min", models.DecimalField(decimal_places=6, max_digits=40)),
+                ("max", models.DecimalField(decimal_places=6, max_digits=40)),
+                (
+                    "portfolio",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="portfolioviz.portfolio",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name="weightrollup",
+            index=models.Index(
+                fields=["portfolio", "resolution", "date"],
+                name="weightrollup_resolution_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="weightrollup",
+            constraint=models.UniqueConstraint(
+                fields=("portfolio", "asset", "resolution", "date"),
+                name="weightrollup_portfolio_asset_resolution_date_unique",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="portfoliovaluerollup",
+            constraint=models.UniqueConstraint(
+                fields=("portfolio", "resolution", "date"),
+                name="valuerollup_portfolio_resolution_date_unique",
+            ),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.1.8 on 2026-10-18 16:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfolioviz", "0005_time_series_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SeriesCovariance",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("kind", models.CharField(max_length=10)),
+                ("window", models.PositiveIntegerField()),
+                ("start_date", models.DateField()),
+                ("date", models.DateField()),
+                ("observations", models.PositiveIntegerField()),
+                ("ids", models.BinaryField()),
+                ("sums", models.BinaryField()),
+                ("products", models.BinaryField()),
+                ("covariance", models.BinaryField()),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="seriescovariance",
+            constraint=models.UniqueConstraint(
+                fields=("kind", "window"), name="seriescovariance_kind_window_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+import portfolioviz.fields
+
+
+class Migration(migrations.Migration):
+    ## Same numeric(40, 6) columns in both numeric modes, so only the state
+    ## records the field class and no table is rebuilt
+
+    dependencies = [
+        ("portfolioviz", "0006_series_covariance"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name=model_name,
+                    name="amount",
+                    field=portfolioviz.fields.DerivedAmountField(
+                        decimal_places=6, max_digits=40),
+                )
+                for model_name in ["share", "weight", "portfoliovalue"]
+            ],
+        ),
+    ]
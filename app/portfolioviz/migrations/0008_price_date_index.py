@@ -0,0 +1,17 @@
+# Generated by Django 4.1.8 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("portfolioviz", "0007_derived_amount_numeric"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="price",
+            index=models.Index(fields=["date"], name="price_date_idx"),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from portfolioviz.fields import DerivedAmountField
 from portfolioviz.settings import DATE_FORMAT
 
 
@@ -29,7 +30,7 @@ class Asset(PortfolioBaseModel):
 
 class Share(PortfolioBaseModel):
     portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE)
-    amount = models.DecimalField(decimal_places=6, max_digits=40)
+    amount = DerivedAmountField(decimal_places=6, max_digits=40)
     asset = models.ForeignKey(Asset, on_delete=models.CASCADE)
     date = models.DateField()
     
@@ -40,6 +41,12 @@ class Share(PortfolioBaseModel):
             "amount": self.amount,
             "date": self.date.strftime(DATE_FORMAT)}
 
+    class Meta(PortfolioBaseModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['portfolio', 'asset', 'date'],
+                name='share_portfolio_asset_date_unique')]
+
 
 class Price(PortfolioBaseModel):
     amount = models.DecimalField(decimal_places=6, max_digits=40)
@@ -52,6 +59,14 @@ class Price(PortfolioBaseModel):
             "date": self.date.strftime(DATE_FORMAT),
             "asset_name": self.asset.name}
 
+    class Meta(PortfolioBaseModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['asset', 'date'],
+                name='price_asset_date_unique')]
+        indexes = [
+            models.Index(fields=['date'], name='price_date_idx')]
+
 
 class Quantity(PortfolioBaseModel):
     portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE)
@@ -61,6 +76,12 @@ class Quantity(PortfolioBaseModel):
     
     def to_dict(self):
         return {"amount": self.amount}
+
+    class Meta(PortfolioBaseModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['portfolio', 'asset', 'date'],
+                name='quantity_portfolio_asset_date_unique')]
     
 
 class QuantityTransaction(PortfolioBaseModel):
@@ -74,9 +95,15 @@ class QuantityTransaction(PortfolioBaseModel):
             "amount": self.amount,
             "date": self.date.strftime(DATE_FORMAT)}
 
+    class Meta(PortfolioBaseModel.Meta):
+        indexes = [
+            models.Index(
+                fields=['portfolio', 'date'],
+                name='transaction_portfolio_date_idx')]
+
 
 class Weight(PortfolioBaseModel):
-    amount = models.DecimalField(decimal_places=6, max_digits=40)
+    amount = DerivedAmountField(decimal_places=6, max_digits=40)
     portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE)
     asset = models.ForeignKey(Asset, on_delete=models.CASCADE)
     date = models.DateField()
@@ -87,13 +114,112 @@ class Weight(PortfolioBaseModel):
             "date": self.date.strftime(DATE_FORMAT),
             "asset_name": self.asset.name}
 
+    class Meta(PortfolioBaseModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['portfolio', 'asset', 'date'],
+                name='weight_portfolio_asset_date_unique')]
+        indexes = [
+            models.Index(
+                fields=['portfolio', 'date'],
+                name='weight_portfolio_date_idx')]
+
 
 class PortfolioValue(PortfolioBaseModel):
-    amount = models.DecimalField(decimal_places=6, max_digits=40)
+    amount = DerivedAmountField(decimal_places=6, max_digits=40)
     portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE)
     date = models.DateField()
     
     def to_dict(self):
         return {
             "amount": self.amount,
-            "date": self.date.strftime(DATE_FORMAT)}
\ No newline at end of file
+            "date": self.date.strftime(DATE_FORMAT)}
+
+    class Meta(PortfolioBaseModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['portfolio', 'date'],
+                name='portfoliovalue_portfolio_date_unique')]
+
+
+class PortfolioSnapshot(PortfolioBaseModel):
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE)
+    date = models.DateField()
+    value = models.DecimalField(decimal_places=6, max_digits=40)
+    shares = models.BinaryField()
+    weights = models.BinaryField()
+
+    class Meta(PortfolioBaseModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['portfolio', 'date'],
+                name='portfoliosnapshot_portfolio_date_unique')]
+
+
+class SeriesCovariance(PortfolioBaseModel):
+    ## Covariance of the daily returns of assets or portfolios over the
+    ## last window dates up to date. Matrices are packed upper triangles,
+    ## row by row, over the sorted ids
+    kind = models.CharField(max_length=10)
+    window = models.PositiveIntegerField()
+    start_date = models.DateField()
+    date = models.DateField()
+    observations = models.PositiveIntegerField()
+    ids = models.BinaryField()
+    sums = models.BinaryField()
+    products = models.BinaryField()
+    covariance = models.BinaryField()
+
+    class Meta(PortfolioBaseModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'window'],
+                name='seriescovariance_kind_window_unique')]
+
+
+class PortfolioValueRollup(PortfolioBaseModel):
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=10)
+    date = models.DateField()
+    last = models.DecimalField(decimal_places=6, max_digits=40)
+    mean = models.DecimalField(decimal_places=6, max_digits=40)
+    min = models.DecimalField(decimal_places=6, max_digits=40)
+    max = models.DecimalField(decimal_places=6, max_digits=40)
+
+    def to_dict(self):
+        return {
+            "amount": self.last,
+            "mean": self.mean,
+            "min": self.min,
+            "max": self.max,
+            "date": self.date.strftime(DATE_FORMAT)}
+
+    class Meta(PortfolioBaseModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['portfolio', 'resolution', 'date'],
+                name='valuerollup_portfolio_resolution_date_unique')]
+
+
+class WeightRollup(PortfolioBaseModel):
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE)
+    asset = models.ForeignKey(Asset, on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=10)
+    date = models.DateField()
+    amount = models.DecimalField(decimal_places=6, max_digits=40)
+
+    def to_dict(self):
+        return {
+            "amount": self.amount,
+            "date": self.date.strftime(DATE_FORMAT),
+            "asset_name": self.asset.name}
+
+    class Meta(PortfolioBaseModel.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=['portfolio', 'asset', 'resolution', 'date'],
+                name='weightrollup_portfolio_asset_resolution_date_unique')]
+        indexes = [
+            models.Index(
+                fields=['portfolio', 'resolution', 'date'],
+                name='weightrollup_resolution_idx')]
@@ -0,0 +1,81 @@
+import cProfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+from functools import wraps
+from pathlib import Path
+from typing import Dict, List
+from django.db import connection
+
+
+@dataclass
+class StageReport:
+  name: str
+  calls: int = 0
+  seconds: float = 0.0
+  rows: int = 0
+  queries: int = 0
+  peak_memory_bytes: int = 0
+  profile: cProfile.Profile = field(default=None, repr=False)
+
+
+class LoadProfiler:
+  
+  def __init__(self, enabled: bool = False, cprofile: bool = False) -> None:
+    self.enabled = enabled
+    self.cprofile = cprofile
+    self.stages: Dict[str, StageReport] = {}
+  
+  @contextmanager
+  def stage(self, name: str):
+    report = self.stages.setdefault(name, StageReport(name))
+    if not self.enabled:
+      yield report
+      return
+    
+    queries = []
+    if self.cprofile and report.profile is None:
+      report.profile = cProfile.Profile()
+    tracemalloc.start()
+    start = time.perf_counter()
+    with connection.execute_wrapper(
+        lambda execute, *args: queries.append(1) or execute(*args)):
+      if report.profile is not None:
+        report.profile.enable()
+      try:
+        yield report
+      finally:
+        if report.profile is not None:
+          report.profile.disable()
+        report.calls += 1
+        report.seconds += time.perf_counter() - start
+        report.queries += len(queries)
+        report.peak_memory_bytes = max(
+          report.peak_memory_bytes, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+  
+  def report(self) -> List[dict]:
+    return [
+      {
+        report_field.name: getattr(stage, report_field.name)
+        for report_field in fields(StageReport)
+        if report_field.name != 'profile'}
+      for stage in self.stages.values() if stage.calls]
+  
+  def dump_stats(self, directory: Path) -> None:
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for stage in self.stages.values():
+      if stage.profile is not None:
+        stage.profile.dump_stats(directory / f"{stage.name}.prof")
+
+
+def load_stage(method):
+  @wraps(method)
+  def wrapper(self, *args, **kwargs):
+    with self.profiler.stage(method.__name__) as report:
+      rows = method(self, *args, **kwargs)
+      report.rows += rows or 0
+    return rows
+  return wrapper
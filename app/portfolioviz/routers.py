@@ -0,0 +1,22 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+from portfolioviz.settings import SQLITE_REPLICA_ALIAS
+
+
+class ReplicaRouter:
+    
+    def db_for_read(self, model, **hints):
+        ## Reads inside a write transaction, like the loader's, must see its
+        ## uncommitted rows
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return SQLITE_REPLICA_ALIAS
+    
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        ## Both aliases open the same database file
+        return True
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -1,20 +1,56 @@
 from datetime import date
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from django.db import connection
+from django.db.models import ExpressionWrapper, F, FloatField, Max, Min, Sum
 from django.http import Http404
+from portfolioviz.cache import MatrixCache, matrixCache
 from portfolioviz.models import (
   Asset,
   Portfolio,
+  PortfolioSnapshot,
   PortfolioValue,
+  PortfolioValueRollup,
   Price,
   Weight,
+  WeightRollup,
   Quantity,
+  QuantityTransaction,
+  SeriesCovariance,
   Share
 )
-from portfolioviz.constants import INITIAL_DATE
-from portfolioviz.utils import Singleton
+from portfolioviz.constants import (
+  COLUMNAR_STORAGE,
+  CORRELATION_METRIC,
+  COVARIANCE_METRIC,
+  DAILY_RESOLUTION,
+  DERIVED_STORAGE,
+  INITIAL_DATE,
+  STREAM_CHUNK_SIZE
+)
+from portfolioviz.settings import TIME_SERIES_STORAGE
+from portfolioviz.utils import (
+  Singleton,
+  date_range,
+  unpack_array,
+  upper_triangle_take
+)
+
+
+def reads_matrix_cache(matrix_cache: MatrixCache) -> bool:
+  ## Loaders read inside their own transaction, before the data version is
+  ## bumped, so they always go to the database
+  return matrix_cache is not None and not connection.in_atomic_block
 
 
 class MarketInformationSelector(metaclass=Singleton):
   
+  def __init__(self, matrix_cache: MatrixCache = None) -> None:
+    self.matrix_cache = matrix_cache
+  
   def asset_get(self, **kwgs):
     return Asset.objects.get(**kwgs)
   
@@ -24,6 +60,59 @@ class MarketInformationSelector(metaclass=Singleton):
   def price_get(self, asset, date):
     return Price.objects.get(asset=asset, date=date)
   
+  def first_price_date(self) -> date:
+    return Price.objects.aggregate(Min('date'))['date__min']
+  
+  def last_price_date(self) -> date:
+    return Price.objects.aggregate(Max('date'))['date__max']
+  
+  def first_of_last_price_dates(self, count: int) -> Optional[date]:
+    ## None when there are fewer than count price dates
+    dates = Price.objects.order_by('-date').values_list(
+      'date', flat=True).distinct()[count - 1:count]
+    return next(iter(dates), None)
+  
+  def price_frame(
+      self,
+      date_from: date = None,
+      date_to: date = None) -> pd.DataFrame:
+    if reads_matrix_cache(self.matrix_cache) and self.matrix_cache.fits():
+      return self.cached_price_frame(date_from, date_to)
+    prices = Price.objects.all()
+    if date_from is not None or date_to is not None:
+      prices = prices.filter(date__range=date_range(date_from, date_to))
+    prices = pd.DataFrame(
+      prices.values_list('date', 'asset__name', 'amount'),
+      columns=['Dates', 'asset', 'amount'])
+    prices['Dates'] = pd.to_datetime(prices['Dates'])
+    return prices.pivot(
+      index='Dates', columns='asset', values='amount').astype(float)
+  
+  def asset_price_frame(self, date_from: date = None) -> pd.DataFrame:
+    ## Prices by date and asset id, from date_from on
+    prices = Price.objects.all()
+    if date_from is not None:
+      prices = prices.filter(date__gte=date_from)
+    prices = pd.DataFrame(
+      prices.values_list('date', 'asset_id', 'amount'),
+      columns=['date', 'asset_id', 'amount'])
+    return prices.pivot(
+      index='date', columns='asset_id', values='amount').astype(float)
+  
+  def cached_price_frame(self, date_from: date, date_to: date) -> pd.DataFrame:
+    prices = self.matrix_cache.prices()
+    rows = slice(None)
+    if date_from is not None or date_to is not None:
+      rows = prices.rows_between(date_from, date_to)
+    asset_names = dict(Asset.objects.values_list('id', 'name'))
+    return pd.DataFrame(
+      prices.values[rows],
+      index=pd.DatetimeIndex(
+        prices.dates[rows].astype('datetime64[ns]'), name='Dates'),
+      columns=pd.Index(
+        [asset_names[asset_id] for asset_id in prices.asset_ids.tolist()],
+        name='asset'))
+  
   def fetch_initial_operating_date(self) -> date:
     ## TODO: Make with price query
     return INITIAL_DATE
@@ -31,8 +120,14 @@ class MarketInformationSelector(metaclass=Singleton):
 
 class PortfolioSelector(metaclass=Singleton):
   
-  def __init__(self, market_selector: MarketInformationSelector) -> None:
+  def __init__(
+      self,
+      market_selector: MarketInformationSelector,
+      time_series_storage: str = TIME_SERIES_STORAGE,
+      matrix_cache: MatrixCache = None) -> None:
     self.market_selector = market_selector
+    self.time_series_storage = time_series_storage
+    self.matrix_cache = matrix_cache
   
   def portfolio_get(self, **kwgs):
     try:
@@ -43,6 +138,15 @@ class PortfolioSelector(metaclass=Singleton):
   def portfolios_list(self):
     return Portfolio.objects.all()
   
+  def portfolios_get(self, portfolio_ids: List[int]) -> List[Portfolio]:
+    portfolios = Portfolio.objects.in_bulk(portfolio_ids)
+    missing = [
+      portfolio_id for portfolio_id in portfolio_ids
+      if portfolio_id not in portfolios]
+    if missing:
+      raise Http404(f"No such portfolios: {missing}")
+    return [portfolios[portfolio_id] for portfolio_id in portfolio_ids]
+  
   def share_get(self, portfolio, asset, date):
     return Share.objects.get(
       portfolio=portfolio,
@@ -55,38 +159,364 @@ class PortfolioSelector(metaclass=Singleton):
       asset=asset,
       date=date)
   
+  def quantity_amounts(self, portfolio_names: List[str], date):
+    return list(Quantity.objects.filter(
+      portfolio__name__in=portfolio_names,
+      date=date).values_list('portfolio__name', 'asset__name', 'amount'))
+  
+  def transaction_amounts(
+      self,
+      portfolio_names: List[str],
+      date_from: date,
+      date_to: date = None):
+    transactions = QuantityTransaction.objects.filter(
+      portfolio__name__in=portfolio_names, date__gte=date_from)
+    if date_to is not None:
+      transactions = transactions.filter(date__lt=date_to)
+    return list(transactions.values(
+      'portfolio__name', 'asset__name', 'date').annotate(
+      total=Sum('amount')).values_list(
+      'portfolio__name', 'asset__name', 'date', 'total'))
+  
+  def last_quantity_dates(self) -> Dict[str, date]:
+    return dict(Quantity.objects.values('portfolio__name').annotate(
+      last_date=Max('date')).values_list('portfolio__name', 'last_date'))
+  
   def portfolio_value_get(self, portfolio: Portfolio, date):
     return PortfolioValue.objects.get(
       portfolio=portfolio, date=date)
   
-  def portfolio_value_list(
+  def portfolio_value_frame(
+      self,
+      portfolio_id: str,
+      date_from: date,
+      date_to: date,
+      resolution: str = DAILY_RESOLUTION) -> pd.DataFrame:
+    ## Float amounts by date, plus mean, min and max columns for rollups
+    portfolio = self.portfolio_get(id=portfolio_id)
+    return self.portfolio_value_frames(
+      [portfolio.id], date_from, date_to, resolution)[portfolio.id]
+  
+  def portfolio_value_frames(
+      self,
+      portfolio_ids: List[int],
+      date_from: date,
+      date_to: date,
+      resolution: str = DAILY_RESOLUTION) -> Dict[int, pd.DataFrame]:
+    date_range = PortfolioSelector.date_range(date_from, date_to)
+    columns = ['portfolio_id', 'date', 'amount']
+    if resolution != DAILY_RESOLUTION:
+      rows = PortfolioValueRollup.objects.filter(
+        date__range=date_range,
+        portfolio_id__in=portfolio_ids,
+        resolution=resolution).values_list(
+        'portfolio_id', 'date', 'last', 'mean', 'min', 'max')
+      columns = columns + ['mean', 'min', 'max']
+    elif self.time_series_storage == COLUMNAR_STORAGE:
+      rows = PortfolioSnapshot.objects.filter(
+        date__range=date_range,
+        portfolio_id__in=portfolio_ids).values_list(
+        'portfolio_id', 'date', 'value')
+    elif self.time_series_storage == DERIVED_STORAGE:
+      rows = self.share_rows(portfolio_ids, date_from, date_to).groupby(
+        ['portfolio_id', 'date'], as_index=False)['share'].sum().to_numpy()
+    else:
+      rows = PortfolioValue.objects.filter(
+        date__range=date_range,
+        portfolio_id__in=portfolio_ids).values_list(
+        'portfolio_id', 'date', 'amount')
+    values = pd.DataFrame(list(rows), columns=columns).astype(
+      {column: float for column in columns[2:]}).set_index('date').sort_index()
+    by_portfolio = dict(tuple(values.groupby('portfolio_id')))
+    return {
+      portfolio_id: by_portfolio.get(portfolio_id, values.iloc[0:0]).drop(
+        columns='portfolio_id')
+      for portfolio_id in portfolio_ids}
+  
+  def weight_frame(
+      self,
+      portfolio_id: str,
+      date_from: date,
+      date_to: date,
+      resolution: str = DAILY_RESOLUTION) -> pd.DataFrame:
+    ## Float weights by date and asset name
+    portfolio = self.portfolio_get(id=portfolio_id)
+    return self.weight_frames(
+      [portfolio.id], date_from, date_to, resolution)[portfolio.id]
+  
+  def weight_frames(
+      self,
+      portfolio_ids: List[int],
+      date_from: date,
+      date_to: date,
+      resolution: str = DAILY_RESOLUTION) -> Dict[int, pd.DataFrame]:
+    date_range = PortfolioSelector.date_range(date_from, date_to)
+    if resolution != DAILY_RESOLUTION:
+      rows = WeightRollup.objects.filter(
+        date__range=date_range,
+        portfolio_id__in=portfolio_ids,
+        resolution=resolution).values_list(
+        'portfolio_id', 'date', 'asset__name', 'amount')
+    elif self.time_series_storage == COLUMNAR_STORAGE:
+      return self.snapshot_weight_frames(portfolio_ids, date_from, date_to)
+    elif self.time_series_storage == DERIVED_STORAGE:
+      shares = self.share_rows(portfolio_ids, date_from, date_to)
+      shares['share'] = shares.share / shares.groupby(
+        ['portfolio_id', 'date']).share.transform('sum')
+      shares['asset_id'] = shares.asset_id.map(dict(
+        self.market_selector.assets_list().values_list('id', 'name')))
+      rows = shares.to_numpy()
+    else:
+      rows = Weight.objects.filter(
+        date__range=date_range,
+        portfolio_id__in=portfolio_ids).values_list(
+        'portfolio_id', 'date', 'asset__name', 'amount')
+    weights = pd.DataFrame(
+      list(rows), columns=['portfolio_id', 'date', 'asset', 'amount'])
+    by_portfolio = dict(tuple(weights.groupby('portfolio_id')))
+    return {
+      portfolio_id: by_portfolio.get(portfolio_id, weights.iloc[0:0]).pivot(
+        index='date', columns='asset', values='amount').astype(float)
+      for portfolio_id in portfolio_ids}
+  
+  def snapshot_weight_frames(
+      self,
+      portfolio_ids: List[int],
+      date_from: date,
+      date_to: date) -> Dict[int, pd.DataFrame]:
+    snapshots = PortfolioSnapshot.objects.filter(
+      date__range=PortfolioSelector.date_range(date_from, date_to),
+      portfolio_id__in=portfolio_ids).order_by('date').values_list(
+      'portfolio_id', 'date', 'weights')
+    assets = self.snapshot_asset_names()
+    by_portfolio = {portfolio_id: ([], []) for portfolio_id in portfolio_ids}
+    for portfolio_id, dt_date, weights in snapshots:
+      weights = self.snapshot_array(weights, assets)
+      by_portfolio[portfolio_id][0].append(dt_date)
+      by_portfolio[portfolio_id][1].append(np.pad(
+        weights, (0, len(assets) - len(weights)), constant_values=np.nan))
+    return {
+      portfolio_id: pd.DataFrame(
+        np.array(weights).reshape(len(dates), len(assets)),
+        index=pd.Index(dates, name='date'),
+        columns=assets)
+      for portfolio_id, (dates, weights) in by_portfolio.items()}
+  
+  def snapshot_asset_names(self) -> List[str]:
+    ## Snapshot arrays hold one entry per asset in ascending id order, as of
+    ## their load, so assets added later only extend the newer arrays
+    return list(self.market_selector.assets_list().order_by(
+      'id').values_list('name', flat=True))
+  
+  @staticmethod
+  def snapshot_array(blob: bytes, asset_names: List[str]) -> np.ndarray:
+    values = unpack_array(blob)
+    if len(values) > len(asset_names):
+      raise ValueError(
+        f"Snapshot holds {len(values)} assets, {len(asset_names)} exist")
+    return values
+  
+  def share_frame(
+      self,
+      portfolio: Portfolio,
+      date_from: date,
+      date_to: date) -> pd.DataFrame:
+    if self.uses_matrix_cache([portfolio.id]):
+      return self.matrix_cache.shares(portfolio.id, date_from, date_to)
+    shares = self.share_rows([portfolio.id], date_from, date_to)
+    return shares.pivot(
+      index='date', columns='asset_id', values='share').astype(float)
+  
+  def share_rows(
       self,
-      portfolio_id: str, 
+      portfolio_ids: List[int],
+      date_from: date,
+      date_to: date) -> pd.DataFrame:
+    ## Price times quantity for every portfolio, asset and date in one query
+    if self.uses_matrix_cache(portfolio_ids):
+      return pd.concat([
+        self.matrix_cache.shares(portfolio_id, date_from, date_to).stack()
+        .rename('share').reset_index().assign(portfolio_id=portfolio_id)
+        for portfolio_id in portfolio_ids],
+        ignore_index=True)[['portfolio_id', 'date', 'asset_id', 'share']]
+    shares = pd.DataFrame(
+      self.share_queryset(portfolio_ids, date_from, date_to).values_list(
+        'asset__quantity__portfolio_id', 'date', 'asset_id', 'share'),
+      columns=['portfolio_id', 'date', 'asset_id', 'share'])
+    return shares.astype({'share': float})
+  
+  def series_covariance_get(
+      self,
+      kind: str,
+      window: int) -> Optional[SeriesCovariance]:
+    return SeriesCovariance.objects.filter(kind=kind, window=window).first()
+  
+  def covariance_matrix(
+      self,
+      kind: str,
+      window: int,
+      ids: List[int] = None,
+      metric: str = COVARIANCE_METRIC
+  ) -> Tuple[SeriesCovariance, np.ndarray, np.ndarray]:
+    ## The ids x ids block of the stored matrix, all of its ids by default
+    covariance = self.series_covariance_get(kind, window)
+    if covariance is None:
+      raise Http404(f"No {kind} covariance over {window} dates")
+    stored_ids = unpack_array(covariance.ids, '<i8')
+    ids = stored_ids if ids is None else np.asarray(ids, dtype=np.int64)
+    positions = np.searchsorted(stored_ids, ids)
+    found = positions < len(stored_ids)
+    found[found] = stored_ids[positions[found]] == ids[found]
+    if not found.all():
+      missing = ids[~found].tolist()
+      raise Http404(f"No {kind} covariance for ids {missing}")
+    matrix = upper_triangle_take(
+      unpack_array(covariance.covariance, '<f4'), len(stored_ids), positions)
+    if metric == CORRELATION_METRIC:
+      deviations = np.sqrt(np.diag(matrix))
+      with np.errstate(divide='ignore', invalid='ignore'):
+        matrix = matrix / np.outer(deviations, deviations)
+    return covariance, ids, matrix
+  
+  def uses_matrix_cache(self, portfolio_ids: List[int]) -> bool:
+    return (
+      reads_matrix_cache(self.matrix_cache)
+      and self.matrix_cache.fits(portfolio_ids))
+  
+  def share_queryset(
+      self,
+      portfolio_ids: List[int],
       date_from: date,
       date_to: date):
+    return Price.objects.filter(
+      date__range=PortfolioSelector.date_range(date_from, date_to),
+      asset__quantity__portfolio_id__in=portfolio_ids,
+      asset__quantity__date=F('date')).annotate(
+      share=ExpressionWrapper(
+        F('amount') * F('asset__quantity__amount'),
+        output_field=FloatField()))
+  
+  def portfolio_value_stream(
+      self,
+      portfolio_id: str,
+      date_from: date,
+      date_to: date,
+      resolution: str = DAILY_RESOLUTION,
+      chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Tuple[date, Dict]]:
+    ## Lazily yields the amounts of each date in order, reading chunk_size
+    ## rows at a time
+    portfolio = self.portfolio_get(id=portfolio_id)
+    date_range = PortfolioSelector.date_range(date_from, date_to)
+    columns = ['amount']
+    if resolution != DAILY_RESOLUTION:
+      rows = PortfolioValueRollup.objects.filter(
+        date__range=date_range,
+        portfolio=portfolio,
+        resolution=resolution).values_list(
+        'date', 'last', 'mean', 'min', 'max')
+      columns = columns + ['mean', 'min', 'max']
+    elif self.time_series_storage == COLUMNAR_STORAGE:
+      rows = PortfolioSnapshot.objects.filter(
+        date__range=date_range,
+        portfolio=portfolio).values_list('date', 'value')
+    elif self.time_series_storage == DERIVED_STORAGE:
+      shares = self.share_queryset(
+        [portfolio.id], date_from, date_to).values_list(
+        'date', 'share').order_by('date').iterator(chunk_size=chunk_size)
+      return (
+        (dt_date, {'amount': sum(share for _, share in date_shares)})
+        for dt_date, date_shares in groupby(shares, key=itemgetter(0)))
+    else:
+      rows = PortfolioValue.objects.filter(
+        date__range=date_range,
+        portfolio=portfolio).values_list('date', 'amount')
+    return (
+      (row[0], dict(zip(columns, row[1:])))
+      for row in rows.order_by('date').iterator(chunk_size=chunk_size))
+  
+  def weight_stream(
+      self,
+      portfolio_id: str,
+      date_from: date,
+      date_to: date,
+      resolution: str = DAILY_RESOLUTION,
+      chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Tuple[date, Dict]]:
+    ## Lazily yields the weights by asset name of each date in order
     portfolio = self.portfolio_get(id=portfolio_id)
-    return PortfolioValue.objects.filter(
+    date_range = PortfolioSelector.date_range(date_from, date_to)
+    if resolution != DAILY_RESOLUTION:
+      rows = WeightRollup.objects.filter(
+        date__range=date_range,
+        portfolio=portfolio,
+        resolution=resolution).values_list('date', 'asset__name', 'amount')
+    elif self.time_series_storage == COLUMNAR_STORAGE:
+      assets = self.snapshot_asset_names()
+      snapshots = self.snapshot_list(
+        portfolio, date_from, date_to).values_list(
+        'date', 'weights').iterator(chunk_size=chunk_size)
+      return (
+        (
+          dt_date,
+          dict(zip(assets, self.snapshot_array(weights, assets).tolist())))
+        for dt_date, weights in snapshots)
+    elif self.time_series_storage == DERIVED_STORAGE:
+      shares = self.share_queryset(
+        [portfolio.id], date_from, date_to).values_list(
+        'date', 'asset__name', 'share').order_by('date')
+      return (
+        (dt_date, PortfolioSelector.weights_from_shares(date_shares))
+        for dt_date, date_shares in self.grouped_by_date(shares, chunk_size))
+    else:
+      rows = Weight.objects.filter(
+        date__range=date_range,
+        portfolio=portfolio).values_list('date', 'asset__name', 'amount')
+    return self.grouped_by_date(rows.order_by('date', 'asset_id'), chunk_size)
+  
+  @staticmethod
+  def weights_from_shares(shares: Dict[str, float]) -> Dict[str, float]:
+    value = sum(shares.values())
+    return {asset_name: share / value for asset_name, share in shares.items()}
+  
+  @staticmethod
+  def grouped_by_date(
+      rows,
+      chunk_size: int) -> Iterator[Tuple[date, Dict]]:
+    ## rows of (date, key, amount) ordered by date
+    return (
+      (dt_date, {key: amount for _, key, amount in date_rows})
+      for dt_date, date_rows in groupby(
+        rows.iterator(chunk_size=chunk_size), key=itemgetter(0)))
+  
+  def portfolio_value_rollup_list(
+      self,
+      portfolio_id: str,
+      resolution: str,
+      date_from: date,
+      date_to: date):
+    return PortfolioValueRollup.objects.filter(
       date__range=PortfolioSelector.date_range(date_from, date_to),
-      portfolio=portfolio)
+      portfolio=self.portfolio_get(id=portfolio_id),
+      resolution=resolution).order_by('date')
   
-  def weight_list(
+  def weight_rollup_list(
       self,
       portfolio_id: str,
+      resolution: str,
       date_from: date,
       date_to: date):
-    portfolio = self.portfolio_get(id=portfolio_id)
-    return list(Weight.objects.filter(
+    return list(WeightRollup.objects.filter(
       date__range=PortfolioSelector.date_range(date_from, date_to),
-      portfolio=portfolio))
+      portfolio=self.portfolio_get(id=portfolio_id),
+      resolution=resolution).select_related('asset').order_by('date'))
   
-  @staticmethod
-  def date_range(date_from, date_to):
-    return [
-      date_from if date_from is not None else INITIAL_DATE,
-      date_to if date_to is not None else date.today()
-    ]
+  def snapshot_list(self, portfolio: Portfolio, date_from: date, date_to: date):
+    return PortfolioSnapshot.objects.filter(
+      date__range=PortfolioSelector.date_range(date_from, date_to),
+      portfolio=portfolio).order_by('date')
+  
+  date_range = staticmethod(date_range)
 
 
-marketSelector = MarketInformationSelector()
+marketSelector = MarketInformationSelector(matrix_cache=matrixCache)
 
-portfolioSelector = PortfolioSelector(marketSelector)
\ No newline at end of file
+portfolioSelector = PortfolioSelector(marketSelector, matrix_cache=matrixCache)
\ No newline at end of file
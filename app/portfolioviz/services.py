@@ -1,24 +1,64 @@
+import csv
+import hashlib
+import io
+import json
+import numpy as np
 import pandas as pd
-from datetime import date
-from typing import List
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from django.db import connections, router, transaction
 from portfolioviz.models import (
   Asset,
   Portfolio,
+  PortfolioSnapshot,
   PortfolioValue,
+  PortfolioValueRollup,
   Price,
   Quantity,
+  QuantityTransaction,
+  SeriesCovariance,
   Weight,
+  WeightRollup,
   Share
 )
+from portfolioviz.cache import timeSeriesCache
+from portfolioviz.profiling import LoadProfiler, load_stage
 from portfolioviz.selectors import (
   marketSelector,
   portfolioSelector
 )
-from portfolioviz.settings import DATA_PATH_NAME
-from portfolioviz.constants import INITIAL_VALUE, INITIAL_DATE
-from portfolioviz.utils import Singleton
+from portfolioviz.constants import (
+  ASSET_COVARIANCE,
+  PORTFOLIO_COVARIANCE,
+  BULK_CREATE_BATCH_SIZE,
+  COLUMNAR_STORAGE,
+  COVARIANCE_WINDOW,
+  DERIVED_STORAGE,
+  INITIAL_DATE,
+  INITIAL_VALUE,
+  LOAD_CHUNK_SIZE,
+  PRICES_SHEET_NAME,
+  ROLLUP_FREQUENCIES,
+  SOURCE_CHUNK_ROWS,
+  TRADING_DAYS,
+  WEIGHTS_SHEET_NAME
+)
+from portfolioviz.settings import (
+  DATA_CACHE_DIR,
+  DATA_PATH_NAME,
+  TIME_SERIES_STORAGE
+)
+from portfolioviz.utils import (
+  Singleton,
+  batched,
+  pack_array,
+  pack_upper_triangle,
+  unpack_array,
+  upper_triangle_take
+)
 
 logger = logging.getLogger(__name__)
 
@@ -34,10 +74,103 @@ class RawPortfolioData:
 	initial_value: int
 
 
+@dataclass
+class ComputedPortfolioData:
+  dates: List[date]
+  assets: List[str]
+  portfolios: List[str]
+  prices: np.ndarray
+  quantities: np.ndarray
+  shares: np.ndarray
+  values: np.ndarray
+  weights: np.ndarray
+
+
+@dataclass
+class RollupPeriod:
+  ## Running aggregates of one period by portfolio, with the weights on its
+  ## last date, carried to the next chunk while the period may go on
+  resolution: str
+  period: pd.Period
+  last_date: pd.Timestamp
+  sums: np.ndarray
+  counts: np.ndarray
+  mins: np.ndarray
+  maxs: np.ndarray
+  lasts: np.ndarray
+  weights: np.ndarray
+  
+  def merge(self, later: 'RollupPeriod') -> 'RollupPeriod':
+    return RollupPeriod(
+      self.resolution,
+      self.period,
+      later.last_date,
+      self.sums + later.sums,
+      self.counts + later.counts,
+      np.fmin(self.mins, later.mins),
+      np.fmax(self.maxs, later.maxs),
+      later.lasts,
+      later.weights)
+
+
+def bulk_create(model, instances: Iterable, batch_size: int) -> int:
+  created = 0
+  connection = connections[router.db_for_write(model)]
+  with transaction.atomic(using=connection.alias):
+    for batch in batched(instances, batch_size):
+      if connection.vendor == 'postgresql':
+        copy_from_stdin(connection, model, batch)
+      else:
+        model.objects.bulk_create(batch, batch_size=batch_size)
+      created += len(batch)
+    transaction.on_commit(timeSeriesCache.invalidate, using=connection.alias)
+  return created
+
+
+def copy_from_stdin(connection, model, instances: List) -> None:
+  ## COPY streams the whole batch as CSV instead of parsing INSERT statements
+  fields = [
+    field for field in model._meta.concrete_fields
+    if field is not model._meta.auto_field]
+  columns = ', '.join(
+    connection.ops.quote_name(field.column) for field in fields)
+  with connection.cursor() as cursor:
+    cursor.copy_expert(
+      f"COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) "
+      f"FROM STDIN WITH (FORMAT csv)",
+      copy_csv(connection, fields, instances))
+
+
+def copy_csv(connection, fields: List, instances: List) -> io.StringIO:
+  buffer = io.StringIO()
+  csv.writer(buffer).writerows(
+    [copy_value(connection, field, instance) for field in fields]
+    for instance in instances)
+  buffer.seek(0)
+  return buffer
+
+
+def copy_value(connection, field, instance):
+  value = getattr(instance, field.attname)
+  if value is None:
+    ## An unquoted empty field is NULL in CSV COPY
+    return None
+  if isinstance(value, (bytes, memoryview)):
+    return '\\x' + bytes(value).hex()
+  return field.get_db_prep_save(value, connection)
+
+
 class MarketService(metaclass=Singleton):
   
   def asset_create(self, name):
     Asset.objects.create(name=name)
+  
+  def assets_bulk_create(
+      self,
+      names: Iterable[str],
+      batch_size: int = BULK_CREATE_BATCH_SIZE) -> int:
+    return bulk_create(
+      Asset, (Asset(name=name) for name in names), batch_size)
 
 
 class PortfolioService(metaclass=Singleton):
@@ -77,6 +210,184 @@ class PortfolioService(metaclass=Singleton):
       asset=asset,
       amount=amount,
       date=date)
+  
+  def portfolios_bulk_create(
+      self,
+      names: Iterable[str],
+      batch_size: int = BULK_CREATE_BATCH_SIZE) -> int:
+    return bulk_create(
+      Portfolio, (Portfolio(name=name) for name in names), batch_size)
+  
+  def quantities_bulk_create(
+      self,
+      rows: Iterable[Tuple[Portfolio, Asset, float, date]],
+      batch_size: int = BULK_CREATE_BATCH_SIZE) -> int:
+    return bulk_create(
+      Quantity,
+      (
+        Quantity(portfolio=portfolio, asset=asset, amount=amount, date=date)
+        for portfolio, asset, amount, date in rows),
+      batch_size)
+  
+  def weights_bulk_create(
+      self,
+      rows: Iterable[Tuple[Portfolio, Asset, date, float]],
+      batch_size: int = BULK_CREATE_BATCH_SIZE) -> int:
+    return bulk_create(
+      Weight,
+      (
+        Weight(portfolio=portfolio, asset=asset, date=date, amount=raw_weight)
+        for portfolio, asset, date, raw_weight in rows),
+      batch_size)
+  
+  def portfolio_values_bulk_create(
+      self,
+      rows: Iterable[Tuple[Portfolio, date, float]],
+      batch_size: int = BULK_CREATE_BATCH_SIZE) -> int:
+    return bulk_create(
+      PortfolioValue,
+      (
+        PortfolioValue(portfolio=portfolio, date=date, amount=amount)
+        for portfolio, date, amount in rows),
+      batch_size)
+  
+  def prices_bulk_create(
+      self,
+      rows: Iterable[Tuple[float, Asset, date]],
+      batch_size: int = BULK_CREATE_BATCH_SIZE) -> int:
+    return bulk_create(
+      Price,
+      (
+        Price(amount=amount, asset=asset, date=date)
+        for amount, asset, date in rows),
+      batch_size)
+  
+  def shares_bulk_create(
+      self,
+      rows: Iterable[Tuple[Portfolio, Asset, date, float]],
+      batch_size: int = BULK_CREATE_BATCH_SIZE) -> int:
+    return bulk_create(
+      Share,
+      (
+        Share(portfolio=portfolio, asset=asset, date=date, amount=amount)
+        for portfolio, asset, date, amount in rows),
+      batch_size)
+  
+  def quantity_transactions_bulk_create(
+      self,
+      rows: Iterable[Tuple[Portfolio, Asset, date, float]],
+      batch_size: int = BULK_CREATE_BATCH_SIZE) -> int:
+    return bulk_create(
+      QuantityTransaction,
+      (
+        QuantityTransaction(
+          portfolio=portfolio, asset=asset, date=date, amount=amount)
+        for portfolio, asset, date, amount in rows),
+      batch_size)
+  
+  def portfolio_series_delete(
+      self,
+      portfolio_names: List[str],
+      date_from: date) -> None:
+    for model in [Quantity, Share, Weight, PortfolioValue, PortfolioSnapshot]:
+      model.objects.filter(
+        portfolio__name__in=portfolio_names, date__gte=date_from).delete()
+    self.portfolio_rollups_delete(portfolio_names, None, date_from)
+    ## Covariances over rewritten values can't be slid, the next update
+    ## computes them again
+    SeriesCovariance.objects.filter(
+      kind=PORTFOLIO_COVARIANCE, date__gte=date_from).delete()
+  
+  def portfolio_rollups_delete(
+      self,
+      portfolio_names: List[str],
+      resolution: str = None,
+      date_from: date = None) -> None:
+    for model in [PortfolioValueRollup, WeightRollup]:
+      rollups = model.objects.filter(portfolio__name__in=portfolio_names)
+      if resolution is not None:
+        rollups = rollups.filter(resolution=resolution)
+      if date_from is not None:
+        rollups = rollups.filter(date__gte=date_from)
+      rollups.delete()
+    transaction.on_commit(timeSeriesCache.invalidate)
+  
+  def series_covariance_save(
+      self,
+      kind: str,
+      window: int,
+      start_date: date,
+      end_date: date,
+      observations: int,
+      ids: np.ndarray,
+      sums: np.ndarray,
+      products: np.ndarray,
+      covariance: np.ndarray) -> None:
+    ## Running sums stay in float64 for the next incremental update, the
+    ## covariance served to clients is stored in float32
+    SeriesCovariance.objects.update_or_create(
+      kind=kind,
+      window=window,
+      defaults={
+        'start_date': start_date,
+        'date': end_date,
+        'observations': observations,
+        'ids': pack_array(ids, '<i8'),
+        'sums': pack_array(sums),
+        'products': pack_upper_triangle(products),
+        'covariance': pack_upper_triangle(covariance, '<f4')})
+    transaction.on_commit(timeSeriesCache.invalidate)
+  
+  def portfolio_snapshots_bulk_create(
+      self,
+      rows: Iterable[Tuple[Portfolio, date, float, np.ndarray, np.ndarray]],
+      batch_size: int = BULK_CREATE_BATCH_SIZE) -> int:
+    return bulk_create(
+      PortfolioSnapshot,
+      (
+        PortfolioSnapshot(
+          portfolio=portfolio,
+          date=date,
+          value=value,
+          shares=pack_array(shares),
+          weights=pack_array(weights))
+        for portfolio, date, value, shares, weights in rows),
+      batch_size)
+  
+  def portfolio_value_rollups_bulk_create(
+      self,
+      rows: Iterable[Tuple[Portfolio, str, date, float, float, float, float]],
+      batch_size: int = BULK_CREATE_BATCH_SIZE) -> int:
+    return bulk_create(
+      PortfolioValueRollup,
+      (
+        PortfolioValueRollup(
+          portfolio=portfolio,
+          resolution=resolution,
+          date=date,
+          last=last,
+          mean=mean,
+          min=min_amount,
+          max=max_amount)
+        for portfolio, resolution, date, last, mean, min_amount, max_amount
+        in rows),
+      batch_size)
+  
+  def weight_rollups_bulk_create(
+      self,
+      rows: Iterable[Tuple[Portfolio, Asset, str, date, float]],
+      batch_size: int = BULK_CREATE_BATCH_SIZE) -> int:
+    return bulk_create(
+      WeightRollup,
+      (
+        WeightRollup(
+          portfolio=portfolio,
+          asset=asset,
+          resolution=resolution,
+          date=date,
+          amount=amount)
+        for portfolio, asset, resolution, date, amount in rows),
+      batch_size)
 
 
 class EntityRelations:
@@ -94,17 +405,21 @@ class EntityRelations:
     return price * quantity
 
 
-class DataExtractor(metaclass=Singleton):
+class DataExtractor:
+  
+  def __init__(
+      self,
+      data_path: str = DATA_PATH_NAME,
+      cache_dir: Path = DATA_CACHE_DIR) -> None:
+    self.data_path = Path(data_path)
+    self.cache_dir = Path(cache_dir)
     
   def extract_data(self) -> RawPortfolioData:
-    df_initial_weights = pd.read_excel(
-      DATA_PATH_NAME,
-      sheet_name='weights'
-    )
-    df_initial_weights.set_index(['Fecha', 'activos'], inplace=True)
+    cache_path = self.cache_dir / self.source_key()
+    if not cache_path.exists():
+      self.write_cache(cache_path)
+    df_initial_weights, df_prices = self.read_cache(cache_path)
     
-    df_prices=pd.read_excel(DATA_PATH_NAME, sheet_name='Precios')
-    df_prices.set_index('Dates', inplace=True)
     assets = df_prices.columns.tolist()
     dates = df_prices.index.tolist()
     initial_date = dates[0]
@@ -118,6 +433,336 @@ class DataExtractor(metaclass=Singleton):
       dates,
       initial_date,
       INITIAL_VALUE)
+  
+  def source_files(self) -> List[Path]:
+    if not self.data_path.is_dir():
+      return [self.data_path]
+    return [
+      self.sheet_file(PRICES_SHEET_NAME),
+      self.sheet_file(WEIGHTS_SHEET_NAME)]
+  
+  def sheet_file(self, sheet_name: str) -> Path:
+    for suffix in ['.parquet', '.csv']:
+      path = self.data_path / f"{sheet_name}{suffix}"
+      if path.exists():
+        return path
+    raise FileNotFoundError(f"No {sheet_name} file in {self.data_path}")
+  
+  def source_key(self) -> str:
+    digest = hashlib.sha256()
+    for path in self.source_files():
+      digest.update(str(path.stat().st_mtime_ns).encode())
+      with open(path, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(1 << 20), b''):
+          digest.update(block)
+    return digest.hexdigest()[:32]
+  
+  def read_weights(self) -> pd.DataFrame:
+    if self.data_path.is_dir():
+      df_initial_weights = self.read_sheet_file(
+        self.sheet_file(WEIGHTS_SHEET_NAME), 'Fecha')
+    else:
+      df_initial_weights = pd.read_excel(
+        self.data_path,
+        sheet_name=WEIGHTS_SHEET_NAME
+      )
+    df_initial_weights.set_index(['Fecha', 'activos'], inplace=True)
+    return df_initial_weights
+  
+  def read_price_chunks(self) -> Tuple[int, List[str], Iterable[pd.DataFrame]]:
+    if self.data_path.is_dir():
+      path = self.sheet_file(PRICES_SHEET_NAME)
+      if path.suffix == '.csv':
+        with open(path) as csv_file:
+          rows_count = sum(1 for _ in csv_file) - 1
+        assets = pd.read_csv(path, nrows=0, index_col='Dates').columns.tolist()
+        return rows_count, assets, pd.read_csv(
+          path,
+          parse_dates=['Dates'],
+          index_col='Dates',
+          chunksize=SOURCE_CHUNK_ROWS)
+      df_prices = self.read_sheet_file(path, 'Dates')
+    else:
+      df_prices=pd.read_excel(self.data_path, sheet_name=PRICES_SHEET_NAME)
+    df_prices.set_index('Dates', inplace=True)
+    return len(df_prices), df_prices.columns.tolist(), [df_prices]
+  
+  def read_sheet_file(self, path: Path, date_column: str) -> pd.DataFrame:
+    if path.suffix == '.parquet':
+      df = pd.read_parquet(path)
+      ## Frames written with to_parquet keep their index as the index
+      if date_column not in df.columns:
+        df.reset_index(inplace=True)
+      df[date_column] = pd.to_datetime(df[date_column])
+      return df
+    return pd.read_csv(path, parse_dates=[date_column])
+  
+  def write_cache(self, cache_path: Path) -> None:
+    partial_path = cache_path.with_suffix('.partial')
+    partial_path.mkdir(parents=True, exist_ok=True)
+    
+    rows_count, assets, price_chunks = self.read_price_chunks()
+    prices = np.lib.format.open_memmap(
+      partial_path / 'prices.npy',
+      mode='w+',
+      dtype=float,
+      shape=(rows_count, len(assets)))
+    dates = np.lib.format.open_memmap(
+      partial_path / 'dates.npy',
+      mode='w+',
+      dtype='datetime64[ns]',
+      shape=(rows_count,))
+    start = 0
+    for df_prices in price_chunks:
+      end = start + len(df_prices)
+      if end > rows_count:
+        raise ValueError(
+          f"Read {end} price rows, more than the {rows_count} counted")
+      prices[start:end] = df_prices[assets].to_numpy(dtype=float)
+      dates[start:end] = df_prices.index.to_numpy(dtype='datetime64[ns]')
+      start = end
+    prices.flush()
+    dates.flush()
+    del prices, dates
+    ## Line counts include blank lines the parser skips
+    if start < rows_count:
+      self.truncate_array(partial_path / 'prices.npy', start)
+      self.truncate_array(partial_path / 'dates.npy', start)
+    
+    with open(partial_path / 'assets.json', 'w') as assets_file:
+      json.dump([str(asset) for asset in assets], assets_file)
+    self.read_weights().to_csv(partial_path / 'weights.csv')
+    partial_path.rename(cache_path)
+  
+  @staticmethod
+  def truncate_array(path: Path, rows_count: int) -> None:
+    truncated_path = path.with_suffix('.truncated.npy')
+    np.save(truncated_path, np.load(path, mmap_mode='r')[:rows_count])
+    truncated_path.replace(path)
+  
+  def read_cache(self, cache_path: Path) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    with open(cache_path / 'assets.json') as assets_file:
+      assets = json.load(assets_file)
+    df_prices = pd.DataFrame(
+      np.load(cache_path / 'prices.npy', mmap_mode='r'),
+      index=pd.DatetimeIndex(np.load(cache_path / 'dates.npy'), name='Dates'),
+      columns=assets)
+    df_initial_weights = pd.read_csv(
+      cache_path / 'weights.csv',
+      parse_dates=['Fecha'],
+      index_col=['Fecha', 'activos'])
+    return df_initial_weights, df_prices
+
+
+class SyntheticDataExtractor:
+  
+  def __init__(
+      self,
+      assets_count: int,
+      portfolios_count: int,
+      dates_count: int,
+      seed: int = 0) -> None:
+    self.assets_count = assets_count
+    self.portfolios_count = portfolios_count
+    self.dates_count = dates_count
+    self.seed = seed
+  
+  def extract_data(self) -> RawPortfolioData:
+    rng = np.random.default_rng(self.seed)
+    assets = [f"ASSET_{i}" for i in range(self.assets_count)]
+    portfolios = [f"PORTFOLIO_{i}" for i in range(self.portfolios_count)]
+    dates = pd.bdate_range(
+      INITIAL_DATE, periods=self.dates_count, name='Dates').tolist()
+    
+    returns = rng.normal(0.0003, 0.02, (self.dates_count, self.assets_count))
+    returns[0] = 0
+    df_prices = pd.DataFrame(
+      100 * np.exp(np.cumsum(returns, axis=0)),
+      index=pd.Index(dates, name='Dates'),
+      columns=assets)
+    
+    df_initial_weights = pd.DataFrame(
+      rng.dirichlet(np.ones(self.assets_count), self.portfolios_count).T,
+      index=pd.MultiIndex.from_product(
+        [[dates[0]], assets], names=['Fecha', 'activos']),
+      columns=portfolios)
+    
+    return RawPortfolioData(
+      assets,
+      portfolios,
+      df_initial_weights,
+      df_prices,
+      dates,
+      dates[0],
+      INITIAL_VALUE)
+
+
+class PortfolioCalculator(metaclass=Singleton):
+  
+  def compute(self, raw_data: RawPortfolioData) -> ComputedPortfolioData:
+    return self.compute_from_quantities(
+      raw_data, self.initial_quantity_matrix(raw_data))
+  
+  def simulate(
+      self,
+      prices: pd.DataFrame,
+      initial_weights: pd.DataFrame,
+      initial_value: float) -> ComputedPortfolioData:
+    ## Holds the candidate weights (assets x portfolios) from the first date
+    ## of prices on, entirely in memory
+    dates = prices.index.tolist()
+    return self.compute(RawPortfolioData(
+      initial_weights.index.tolist(),
+      initial_weights.columns.tolist(),
+      pd.concat({dates[0]: initial_weights}),
+      prices,
+      dates,
+      dates[0],
+      initial_value))
+  
+  def compute_from_quantities(
+      self,
+      raw_data: RawPortfolioData,
+      initial_quantities: np.ndarray,
+      transactions: np.ndarray = None) -> ComputedPortfolioData:
+    prices = self.price_matrix(raw_data)
+    quantities, shares, values, weights = self.portfolio_series(
+      prices, initial_quantities, transactions)
+    
+    return ComputedPortfolioData(
+      [tt_date.date() for tt_date in raw_data.dates],
+      list(raw_data.assets),
+      list(raw_data.portfolios),
+      prices,
+      quantities,
+      shares,
+      values,
+      weights)
+  
+  @staticmethod
+  def portfolio_series(
+      prices: np.ndarray,
+      initial_quantities: np.ndarray,
+      transactions: np.ndarray = None) -> Tuple[np.ndarray, ...]:
+    quantities = np.repeat(
+      initial_quantities[:, np.newaxis, :], len(prices), axis=1)
+    if transactions is not None:
+      ## Transactions of a date change the quantities from the next date on
+      quantities += np.cumsum(transactions, axis=1) - transactions
+    shares = EntityRelations.share_from_price_quantity(
+      prices[np.newaxis, :, :], quantities)
+    values = shares.sum(axis=2)
+    weights = EntityRelations.weight_from_share_value(
+      shares, values[:, :, np.newaxis])
+    return quantities, shares, values, weights
+  
+  @staticmethod
+  def rollup_periods(
+      computed: ComputedPortfolioData,
+      resolution: str,
+      open_period: RollupPeriod = None) -> List[RollupPeriod]:
+    ## The periods of the chunk in order, the first one merged with the period
+    ## the previous chunk left open. Only the last one may go on afterwards
+    dates = pd.DatetimeIndex(computed.dates)
+    periods = dates.to_period(ROLLUP_FREQUENCIES[resolution])
+    starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+    rollup_periods = [] if open_period is None else [open_period]
+    for start, end in zip(starts, np.r_[starts[1:], len(dates)]):
+      values = computed.values[:, start:end]
+      period = RollupPeriod(
+        resolution,
+        periods[start],
+        dates[end - 1],
+        values.sum(axis=1),
+        np.full(len(values), end - start),
+        values.min(axis=1),
+        values.max(axis=1),
+        values[:, -1].copy(),
+        computed.weights[:, end - 1].copy())
+      if rollup_periods and rollup_periods[-1].period == period.period:
+        period = rollup_periods.pop().merge(period)
+      rollup_periods.append(period)
+    return rollup_periods
+  
+  @staticmethod
+  def analytics(
+      values: np.ndarray,
+      risk_free_rate: float = 0.0) -> Dict[str, float]:
+    ## Annualized over TRADING_DAYS daily returns; NaN where there are too
+    ## few values to tell
+    metrics = dict.fromkeys([
+      'total_return',
+      'annualized_return',
+      'volatility',
+      'sharpe_ratio',
+      'max_drawdown'], np.nan)
+    metrics['observations'] = len(values)
+    if not len(values):
+      return metrics
+    returns = values[1:] / values[:-1] - 1
+    metrics['total_return'] = float(values[-1] / values[0] - 1)
+    metrics['max_drawdown'] = float(
+      (values / np.maximum.accumulate(values) - 1).min())
+    if len(returns):
+      metrics['annualized_return'] = float(
+        (1 + metrics['total_return']) ** (TRADING_DAYS / len(returns)) - 1)
+    if len(returns) > 1:
+      volatility = returns.std(ddof=1) * np.sqrt(TRADING_DAYS)
+      metrics['volatility'] = float(volatility)
+      if volatility:
+        metrics['sharpe_ratio'] = float(
+          (returns.mean() * TRADING_DAYS - risk_free_rate) / volatility)
+    return metrics
+  
+  @staticmethod
+  def rolling_analytics(
+      values: pd.Series,
+      window: int,
+      risk_free_rate: float = 0.0) -> pd.DataFrame:
+    ## The same metrics over the window values ending on each date
+    returns = values.pct_change()
+    volatility = returns.rolling(window - 1).std() * np.sqrt(TRADING_DAYS)
+    max_drawdowns = np.full(len(values), np.nan)
+    if len(values) >= window:
+      windows = np.lib.stride_tricks.sliding_window_view(
+        values.to_numpy(), window)
+      max_drawdowns[window - 1:] = (
+        windows / np.maximum.accumulate(windows, axis=1) - 1).min(axis=1)
+    return pd.DataFrame({
+      'return': values / values.shift(window - 1) - 1,
+      'volatility': volatility,
+      'sharpe_ratio': (
+        returns.rolling(window - 1).mean() * TRADING_DAYS - risk_free_rate
+      ) / volatility.replace(0, np.nan),
+      'max_drawdown': max_drawdowns}, index=values.index)
+  
+  @staticmethod
+  def covariance(
+      sums: np.ndarray,
+      products: np.ndarray,
+      observations: int) -> np.ndarray:
+    ## Sample covariance from the sums of returns and of their products
+    with np.errstate(divide='ignore', invalid='ignore'):
+      return (
+        products - np.outer(sums, sums) / observations) / (observations - 1)
+  
+  def price_matrix(self, raw_data: RawPortfolioData) -> np.ndarray:
+    return raw_data.prices.loc[raw_data.dates, raw_data.assets].to_numpy(
+      dtype=float)
+  
+  def initial_weight_matrix(self, raw_data: RawPortfolioData) -> np.ndarray:
+    initial_weights = raw_data.initial_weights.xs(
+      raw_data.initial_date, level=0)
+    return initial_weights.reindex(raw_data.assets)[
+      raw_data.portfolios].to_numpy(dtype=float).T
+  
+  def initial_quantity_matrix(self, raw_data: RawPortfolioData) -> np.ndarray:
+    initial_prices = raw_data.prices.loc[
+      raw_data.initial_date, raw_data.assets].to_numpy(dtype=float)
+    return EntityRelations.quantity_from_weight_value_price(
+      self.initial_weight_matrix(raw_data),
+      raw_data.initial_value,
+      initial_prices)
 
 
 class EntityLoader:
@@ -126,125 +771,608 @@ class EntityLoader:
       market_selector,
       portfolio_selector,
       market_service,
-      portfolio_service) -> None:
+      portfolio_service,
+      portfolio_calculator,
+      time_series_storage: str = TIME_SERIES_STORAGE,
+      profiler: LoadProfiler = None) -> None:
     self.market_selector = market_selector
     self.market_service= market_service
     self.portfolio_selector = portfolio_selector
     self.portfolio_service = portfolio_service
+    self.portfolio_calculator = portfolio_calculator
+    self.time_series_storage = time_series_storage
+    self.profiler = profiler or LoadProfiler()
   
-  def populate_db(self, raw_data: RawPortfolioData) -> None:
+  def populate_db(
+      self,
+      raw_data: RawPortfolioData,
+      batch_size: int = BULK_CREATE_BATCH_SIZE,
+      chunk_size: int = LOAD_CHUNK_SIZE) -> None:
     logger.debug("This might take a while...")
-    self.portfolios_load(raw_data)
-    self.assets_load(raw_data)
-    self.prices_load(raw_data)
-    self.quantities_initial_load(raw_data)
-    self.quantities_load_all_periods(raw_data)
-    self.share_load_all_periods(raw_data)
-    self.portfolio_values_load_all_periods(raw_data)
-    self.weights_load_all_periods(raw_data)
-
-  def all_dates(self, raw_data: RawPortfolioData):
-    return list(map(lambda x: x.date(), raw_data.dates))
-  
-  def portfolios_load(self, raw_data: RawPortfolioData) -> None:
+    with transaction.atomic():
+      self.portfolios_load(raw_data, batch_size)
+      self.assets_load(raw_data, batch_size)
+      self.load_in_chunks(
+        raw_data,
+        self.portfolio_calculator.initial_quantity_matrix(raw_data),
+        self.persist,
+        batch_size,
+        chunk_size,
+        self.open_rollup_periods(raw_data.portfolios, None))
+  
+  def append(
+      self,
+      raw_data: RawPortfolioData,
+      batch_size: int = BULK_CREATE_BATCH_SIZE,
+      chunk_size: int = LOAD_CHUNK_SIZE) -> None:
+    self.check_known_entities(raw_data)
+    with transaction.atomic():
+      price_data = self.raw_data_since(
+        raw_data, self.market_selector.last_price_date(), [])
+      self.load_in_chunks(
+        price_data,
+        np.zeros((0, len(price_data.assets))),
+        self.prices_load,
+        batch_size,
+        chunk_size)
+      self.portfolio_series_append(raw_data, batch_size, chunk_size)
+  
+  def check_known_entities(self, raw_data: RawPortfolioData) -> None:
+    ## Appended data only extends existing series, new entities need a full
+    ## load so that their history starts from the initial weights, and
+    ## stored ones left out would lose their holdings from the new dates on
+    assets = [asset.name for asset in self.market_selector.assets_list()]
+    portfolios = [
+      portfolio.name for portfolio in self.portfolio_selector.portfolios_list()]
+    new_assets = [name for name in raw_data.assets if name not in assets]
+    new_portfolios = [
+      name for name in raw_data.portfolios if name not in portfolios]
+    if new_assets or new_portfolios:
+      raise ValueError(
+        f"Cannot append unknown assets {new_assets} "
+        f"or portfolios {new_portfolios}, reload the data instead")
+    missing_assets = [name for name in assets if name not in raw_data.assets]
+    missing_portfolios = [
+      name for name in portfolios if name not in raw_data.portfolios]
+    if missing_assets or missing_portfolios:
+      raise ValueError(
+        f"Appended data lacks stored assets {missing_assets} "
+        f"or portfolios {missing_portfolios}")
+  
+  def recompute_from(
+      self,
+      from_date: date,
+      portfolio_names: List[str] = None,
+      batch_size: int = BULK_CREATE_BATCH_SIZE,
+      chunk_size: int = LOAD_CHUNK_SIZE) -> None:
+    with transaction.atomic():
+      if portfolio_names is None:
+        portfolio_names = [
+          portfolio.name
+          for portfolio in self.portfolio_selector.portfolios_list()]
+      first_date = self.market_selector.first_price_date()
+      if first_date is None:
+        return
+      ## Initial quantities come from the initial weights, not transactions
+      from_date = max(from_date, first_date + timedelta(days=1))
+      logger.debug(f"Recomputing portfolio series from {from_date}")
+      self.portfolio_service.portfolio_series_delete(portfolio_names, from_date)
+      ## Series are carried from the last date left of each portfolio, which
+      ## is the trading day before from_date unless a portfolio lags behind
+      last_dates = self.portfolio_selector.last_quantity_dates()
+      date_from = min(
+        (last_dates[name] for name in portfolio_names if name in last_dates),
+        default=None)
+      self.portfolio_series_append(
+        self.market_raw_data(portfolio_names, date_from),
+        batch_size,
+        chunk_size)
+  
+  def apply_transactions(
+      self,
+      rows: Iterable[Tuple[Portfolio, Asset, date, float]],
+      batch_size: int = BULK_CREATE_BATCH_SIZE,
+      chunk_size: int = LOAD_CHUNK_SIZE) -> None:
+    rows = list(rows)
+    if not rows:
+      return
+    with transaction.atomic():
+      self.portfolio_service.quantity_transactions_bulk_create(rows, batch_size)
+      self.recompute_from(
+        min(dt_date for _, _, dt_date, _ in rows),
+        sorted({portfolio.name for portfolio, _, _, _ in rows}),
+        batch_size,
+        chunk_size)
+  
+  def market_raw_data(
+      self,
+      portfolio_names: List[str],
+      date_from: date = None) -> RawPortfolioData:
+    df_prices = self.market_selector.price_frame(date_from)
+    dates = df_prices.index.tolist()
+    return RawPortfolioData(
+      df_prices.columns.tolist(),
+      portfolio_names,
+      None,
+      df_prices,
+      dates,
+      dates[0],
+      INITIAL_VALUE)
+  
+  def portfolio_series_append(
+      self,
+      raw_data: RawPortfolioData,
+      batch_size: int,
+      chunk_size: int) -> None:
+    last_dates = self.portfolio_selector.last_quantity_dates()
+    for last_date in sorted(set(last_dates.values())):
+      portfolio_names = [
+        name for name in raw_data.portfolios
+        if last_dates.get(name) == last_date]
+      new_data = self.raw_data_since(raw_data, last_date, portfolio_names)
+      if not new_data.dates or not portfolio_names:
+        continue
+      logger.debug(f"Appending {len(new_data.dates)} dates after {last_date}")
+      self.load_in_chunks(
+        new_data,
+        self.carried_quantities(new_data, last_date),
+        self.portfolio_series_load,
+        batch_size,
+        chunk_size,
+        self.open_rollup_periods(
+          new_data.portfolios, new_data.dates[0].date()))
+  
+  def load_in_chunks(
+      self,
+      raw_data: RawPortfolioData,
+      initial_quantities: np.ndarray,
+      load: Callable[[ComputedPortfolioData, int], None],
+      batch_size: int,
+      chunk_size: int,
+      rollup_periods: Dict[str, Optional[RollupPeriod]] = None) -> None:
+    ## Rollups of the periods a chunk closes are written with it, only the
+    ## open period of each resolution is carried to the next chunk
+    quantities = initial_quantities
+    chunk_size = chunk_size or max(len(raw_data.dates), 1)
+    for start in range(0, len(raw_data.dates), chunk_size):
+      end = start + chunk_size
+      chunk = replace(raw_data, dates=raw_data.dates[start:end])
+      transactions = self.transaction_matrix(
+        chunk,
+        raw_data.dates[end].date() if end < len(raw_data.dates) else None)
+      ## Computing a chunk is vectorized over every portfolio and takes a
+      ## tiny fraction of persisting it, so it is not fanned out to processes
+      computed = self.portfolio_calculator.compute_from_quantities(
+        chunk, quantities, transactions)
+      load(computed, batch_size)
+      if rollup_periods is not None:
+        closed_periods = []
+        for resolution, open_period in rollup_periods.items():
+          periods = self.portfolio_calculator.rollup_periods(
+            computed, resolution, open_period)
+          rollup_periods[resolution] = periods.pop() if periods else None
+          closed_periods.extend(periods)
+        self.rollups_load(
+          raw_data.portfolios, raw_data.assets, closed_periods, batch_size)
+      quantities = computed.quantities[:, -1, :]
+      if transactions is not None:
+        quantities = quantities + transactions[:, -1, :]
+    if rollup_periods is not None:
+      self.rollups_load(
+        raw_data.portfolios,
+        raw_data.assets,
+        [period for period in rollup_periods.values() if period is not None],
+        batch_size)
+  
+  def raw_data_since(
+      self,
+      raw_data: RawPortfolioData,
+      last_date: date,
+      portfolio_names: List[str]) -> RawPortfolioData:
+    dates = [
+      tt_date for tt_date in raw_data.dates
+      if last_date is None or tt_date.date() > last_date]
+    return replace(raw_data, portfolios=portfolio_names, dates=dates)
+  
+  def carried_quantities(
+      self,
+      raw_data: RawPortfolioData,
+      last_date: date) -> np.ndarray:
+    quantities = pd.DataFrame(
+      self.portfolio_selector.quantity_amounts(raw_data.portfolios, last_date),
+      columns=['portfolio', 'asset', 'amount'])
+    quantities = quantities.pivot(
+      index='portfolio', columns='asset', values='amount').reindex(
+      index=raw_data.portfolios, columns=raw_data.assets).to_numpy(dtype=float)
+    
+    transactions = self.transaction_matrix(
+      replace(raw_data, dates=[pd.Timestamp(last_date)]),
+      raw_data.dates[0].date())
+    if transactions is not None:
+      quantities += transactions[:, 0, :]
+    return quantities
+  
+  def transaction_matrix(
+      self,
+      raw_data: RawPortfolioData,
+      date_to: date = None) -> Optional[np.ndarray]:
+    ## Transactions from the first date of raw_data up to date_to, summed into
+    ## the last date of raw_data on or before each of them
+    if not raw_data.portfolios or not raw_data.dates:
+      return None
+    rows = self.portfolio_selector.transaction_amounts(
+      raw_data.portfolios, raw_data.dates[0].date(), date_to)
+    if not rows:
+      return None
+    
+    df_transactions = pd.DataFrame(
+      rows, columns=['portfolio', 'asset', 'date', 'amount'])
+    dates = pd.DatetimeIndex(raw_data.dates).normalize()
+    transactions = np.zeros(
+      (len(raw_data.portfolios), len(dates), len(raw_data.assets)))
+    np.add.at(
+      transactions,
+      (
+        pd.Index(raw_data.portfolios).get_indexer(df_transactions.portfolio),
+        dates.searchsorted(
+          pd.DatetimeIndex(df_transactions.date), side='right') - 1,
+        pd.Index(raw_data.assets).get_indexer(df_transactions.asset)),
+      df_transactions.amount.to_numpy(dtype=float))
+    return transactions
+  
+  def persist(
+      self,
+      computed: ComputedPortfolioData,
+      batch_size: int = BULK_CREATE_BATCH_SIZE) -> None:
+    self.prices_load(computed, batch_size)
+    self.portfolio_series_load(computed, batch_size)
+  
+  def portfolio_series_load(
+      self,
+      computed: ComputedPortfolioData,
+      batch_size: int = BULK_CREATE_BATCH_SIZE) -> None:
+    self.quantities_initial_load(computed, batch_size)
+    self.quantities_load_all_periods(computed, batch_size)
+    if self.time_series_storage == DERIVED_STORAGE:
+      return
+    if self.time_series_storage == COLUMNAR_STORAGE:
+      self.snapshots_load_all_periods(computed, batch_size)
+      return
+    self.share_load_all_periods(computed, batch_size)
+    self.portfolio_values_load_all_periods(computed, batch_size)
+    self.weights_load_all_periods(computed, batch_size)
+  
+  def assets_by_name(self, asset_names: List[str]) -> List[Asset]:
+    assets = {
+      asset.name: asset for asset in self.market_selector.assets_list()}
+    return [assets[name] for name in asset_names]
+  
+  def portfolios_by_name(self, portfolio_names: List[str]) -> List[Portfolio]:
+    portfolios = {
+      portfolio.name: portfolio
+      for portfolio in self.portfolio_selector.portfolios_list()}
+    return [portfolios[name] for name in portfolio_names]
+  
+  @load_stage
+  def portfolios_load(self, raw_data: RawPortfolioData, batch_size) -> int:
     logger.debug("Loading portfolios")
-    for portfolio_name in raw_data.portfolios:
-      self.portfolio_service.portfolio_create(portfolio_name)
+    return self.portfolio_service.portfolios_bulk_create(
+      raw_data.portfolios, batch_size)
   
-  def assets_load(self, raw_data: RawPortfolioData):
+  @load_stage
+  def assets_load(self, raw_data: RawPortfolioData, batch_size) -> int:
     logger.debug("Loading assets")
-    for asset in raw_data.assets:
-      self.market_service.asset_create(asset)
+    return self.market_service.assets_bulk_create(raw_data.assets, batch_size)
       
-  def prices_load(self, raw_data: RawPortfolioData) -> None:
+  @load_stage
+  def prices_load(self, computed: ComputedPortfolioData, batch_size) -> int:
     logger.debug("Loading market prices")
-    for tt_date in raw_data.dates:
-      for asset_name in raw_data.assets:
-        asset = self.market_selector.asset_get(name=asset_name)
-        raw_price = raw_data.prices.loc[tt_date][asset_name]
-        self.portfolio_service.price_create(raw_price, asset, tt_date.date())
+    assets = self.assets_by_name(computed.assets)
+    return self.portfolio_service.prices_bulk_create(
+      (
+        (raw_price, asset, dt_date)
+        for dt_date, prices in zip(computed.dates, computed.prices.tolist())
+        for asset, raw_price in zip(assets, prices)),
+      batch_size)
     
-  def quantities_initial_load(self, raw_data: RawPortfolioData) -> None:
-    logger.debug("Calculating and loading initial quantities")
-    for portfolio_name in raw_data.portfolios:
-      portfolio = self.portfolio_selector.portfolio_get(name=portfolio_name)
-      for asset in self.market_selector.assets_list():
-        weight = raw_data.initial_weights.loc[
-          (raw_data.initial_date, asset.name)][portfolio_name]
-        price = raw_data.prices.loc[
-          raw_data.initial_date][asset.name]
-        amount = EntityRelations.quantity_from_weight_value_price(
-            weight, raw_data.initial_value, price)
-        initial_operating_date = INITIAL_DATE
-        
-        self.portfolio_service.quantity_create(
-          portfolio,
-          asset,
-          amount,
-          initial_operating_date)
+  @load_stage
+  def quantities_initial_load(
+      self,
+      computed: ComputedPortfolioData,
+      batch_size) -> int:
+    logger.debug("Loading initial quantities")
+    assets = self.assets_by_name(computed.assets)
+    portfolios = self.portfolios_by_name(computed.portfolios)
+    initial_operating_date = computed.dates[0]
+    return self.portfolio_service.quantities_bulk_create(
+      (
+        (portfolio, asset, amount, initial_operating_date)
+        for portfolio, quantities in zip(
+          portfolios, computed.quantities[:, 0, :].tolist())
+        for asset, amount in zip(assets, quantities)),
+      batch_size)
         
-  def quantities_load_all_periods(self, raw_data: RawPortfolioData) -> None:
-    logger.debug("Calculating and loading remaining quantities")
-    initial_market_date = INITIAL_DATE
-    
-    for portfolio in self.portfolio_selector.portfolios_list():
-      for asset in self.market_selector.assets_list():
-        previous_date = initial_market_date
-        for dt_date in self.all_dates(raw_data):
-          if dt_date==initial_market_date:
-            continue
-          
-          previous_quantity = self.portfolio_selector.quantity_get(
-            portfolio, asset, previous_date)
+  @load_stage
+  def quantities_load_all_periods(
+      self,
+      computed: ComputedPortfolioData,
+      batch_size) -> int:
+    logger.debug("Loading remaining quantities")
+    assets = self.assets_by_name(computed.assets)
+    portfolios = self.portfolios_by_name(computed.portfolios)
+    return self.portfolio_service.quantities_bulk_create(
+      (
+        (portfolio, asset, amount, dt_date)
+        for portfolio, quantities in zip(
+          portfolios, computed.quantities[:, 1:, :].tolist())
+        for dt_date, date_quantities in zip(computed.dates[1:], quantities)
+        for asset, amount in zip(assets, date_quantities)),
+      batch_size)
           
-          ## TODO : complete
-          previous_transactions_amount = 0
-          
-          self.portfolio_service.quantity_create(
-            portfolio,
-            asset,
-            previous_quantity.amount + previous_transactions_amount,
-            dt_date)
-          previous_date = dt_date
-          
-  def share_load_all_periods(self, raw_data: RawPortfolioData):
+  @load_stage
+  def share_load_all_periods(
+      self,
+      computed: ComputedPortfolioData,
+      batch_size) -> int:
     logger.debug("Loading shares")
-    for portfolio in self.portfolio_selector.portfolios_list():
-      for dt_date in self.all_dates(raw_data):
-        for asset in self.market_selector.assets_list():
-          price = self.market_selector.price_get(asset, dt_date)
-          quantity = self.portfolio_selector.quantity_get(portfolio, asset, dt_date)
-          self.portfolio_service.share_create(
-            portfolio,
-            asset,
-            dt_date,
-            EntityRelations.share_from_price_quantity(
-              price.amount, quantity.amount))
-  
-  def portfolio_values_load_all_periods(self, raw_data: RawPortfolioData):
+    assets = self.assets_by_name(computed.assets)
+    portfolios = self.portfolios_by_name(computed.portfolios)
+    return self.portfolio_service.shares_bulk_create(
+      (
+        (portfolio, asset, dt_date, amount)
+        for portfolio, shares in zip(portfolios, computed.shares.tolist())
+        for dt_date, date_shares in zip(computed.dates, shares)
+        for asset, amount in zip(assets, date_shares)),
+      batch_size)
+  
+  @load_stage
+  def portfolio_values_load_all_periods(
+      self,
+      computed: ComputedPortfolioData,
+      batch_size) -> int:
     logger.debug("Loading portfolio values")
-    for portfolio in self.portfolio_selector.portfolios_list():
-      for dt_date in self.all_dates(raw_data):
-        value_amount = 0
-        for asset in self.market_selector.assets_list():
-          share = self.portfolio_selector.share_get(portfolio, asset, dt_date)
-          value_amount += share.amount
-        self.portfolio_service.portfolio_value_create(
-          portfolio, dt_date, value_amount)
-  
-  def weights_load_all_periods(self, raw_data: RawPortfolioData) -> None:
+    portfolios = self.portfolios_by_name(computed.portfolios)
+    return self.portfolio_service.portfolio_values_bulk_create(
+      (
+        (portfolio, dt_date, value_amount)
+        for portfolio, values in zip(portfolios, computed.values.tolist())
+        for dt_date, value_amount in zip(computed.dates, values)),
+      batch_size)
+  
+  @load_stage
+  def weights_load_all_periods(
+      self,
+      computed: ComputedPortfolioData,
+      batch_size) -> int:
     logger.debug("Loading asset weights")
-    for portfolio in self.portfolio_selector.portfolios_list():
-      for dt_date in self.all_dates(raw_data):
-        value = self.portfolio_selector.portfolio_value_get(portfolio, dt_date)
-        for asset in self.market_selector.assets_list():
-          share = self.portfolio_selector.share_get(portfolio, asset, dt_date)
-          self.portfolio_service.weight_create(
-            portfolio,
-            asset,
-            dt_date,
-            EntityRelations.weight_from_share_value(
-              share.amount, value.amount))
+    assets = self.assets_by_name(computed.assets)
+    portfolios = self.portfolios_by_name(computed.portfolios)
+    return self.portfolio_service.weights_bulk_create(
+      (
+        (portfolio, asset, dt_date, raw_weight)
+        for portfolio, weights in zip(portfolios, computed.weights.tolist())
+        for dt_date, date_weights in zip(computed.dates, weights)
+        for asset, raw_weight in zip(assets, date_weights)),
+      batch_size)
+  
+  @load_stage
+  def snapshots_load_all_periods(
+      self,
+      computed: ComputedPortfolioData,
+      batch_size) -> int:
+    logger.debug("Loading portfolio snapshots")
+    assets = self.assets_by_name(computed.assets)
+    asset_ids = sorted(asset.id for asset in assets)
+    ## Readers map array positions to every asset in ascending id order
+    if asset_ids != list(self.market_selector.assets_list().order_by(
+        'id').values_list('id', flat=True)):
+      raise ValueError("Snapshots have to cover every asset")
+    by_asset_id = np.argsort([asset.id for asset in assets])
+    portfolios = self.portfolios_by_name(computed.portfolios)
+    return self.portfolio_service.portfolio_snapshots_bulk_create(
+      (
+        (
+          portfolio,
+          dt_date,
+          computed.values[p_index, d_index],
+          computed.shares[p_index, d_index, by_asset_id],
+          computed.weights[p_index, d_index, by_asset_id])
+        for p_index, portfolio in enumerate(portfolios)
+        for d_index, dt_date in enumerate(computed.dates)),
+      batch_size)
+  
+  def open_rollup_periods(
+      self,
+      portfolio_names: List[str],
+      date_from: date) -> Dict[str, Optional[RollupPeriod]]:
+    ## Every period containing date_from is rebuilt from its first date, so
+    ## its values before date_from open it again. Weights come with the
+    ## first chunk, which starts on date_from
+    open_periods = dict.fromkeys(ROLLUP_FREQUENCIES)
+    for resolution in ROLLUP_FREQUENCIES:
+      period_start = None
+      if date_from is not None:
+        period = pd.Period(date_from, ROLLUP_FREQUENCIES[resolution])
+        period_start = period.start_time.date()
+      self.portfolio_service.portfolio_rollups_delete(
+        portfolio_names, resolution, period_start)
+      if period_start is None or period_start == date_from:
+        continue
+      earlier_values = [
+        self.portfolio_selector.share_frame(
+          portfolio, period_start, date_from - timedelta(days=1)).sum(axis=1)
+        for portfolio in self.portfolios_by_name(portfolio_names)]
+      if all(values.empty for values in earlier_values):
+        continue
+      open_periods[resolution] = RollupPeriod(
+        resolution,
+        period,
+        pd.Timestamp(max(
+          values.index.max() for values in earlier_values
+          if not values.empty)),
+        np.array([values.sum() for values in earlier_values]),
+        np.array([len(values) for values in earlier_values]),
+        np.array([values.min() for values in earlier_values]),
+        np.array([values.max() for values in earlier_values]),
+        np.array([
+          values.iloc[-1] if not values.empty else np.nan
+          for values in earlier_values]),
+        None)
+    return open_periods
+  
+  @load_stage
+  def rollups_load(
+      self,
+      portfolio_names: List[str],
+      asset_names: List[str],
+      rollup_periods: List[RollupPeriod],
+      batch_size) -> int:
+    logger.debug("Loading downsampled rollups")
+    assets = {asset.name: asset for asset in self.market_selector.assets_list()}
+    portfolios = self.portfolios_by_name(portfolio_names)
+    value_rows = [
+      (
+        portfolio,
+        period.resolution,
+        period.last_date.date(),
+        period.lasts[p_index],
+        period.sums[p_index] / period.counts[p_index],
+        period.mins[p_index],
+        period.maxs[p_index])
+      for period in rollup_periods
+      for p_index, portfolio in enumerate(portfolios)]
+    weight_rows = [
+      (
+        portfolio,
+        assets[asset_name],
+        period.resolution,
+        period.last_date.date(),
+        amount)
+      for period in rollup_periods
+      for p_index, portfolio in enumerate(portfolios)
+      for asset_name, amount in zip(asset_names, period.weights[p_index])
+      if amount == amount]
+    created = self.portfolio_service.portfolio_value_rollups_bulk_create(
+      value_rows, batch_size)
+    return created + self.portfolio_service.weight_rollups_bulk_create(
+      weight_rows, batch_size)
+
+
+class CovarianceLoader:
+  
+  def __init__(self,
+      market_selector,
+      portfolio_selector,
+      portfolio_service,
+      portfolio_calculator) -> None:
+    self.market_selector = market_selector
+    self.portfolio_selector = portfolio_selector
+    self.portfolio_service = portfolio_service
+    self.portfolio_calculator = portfolio_calculator
+  
+  def update(
+      self,
+      kind: str,
+      window: int = COVARIANCE_WINDOW,
+      full: bool = False) -> None:
+    ## Slides the stored window over the dates appended since its last
+    ## update, so only the returns entering and leaving it are read. It is
+    ## computed from scratch the first time, when the series changed or when
+    ## full is set. Recomputing portfolio series drops the stored window.
+    with transaction.atomic():
+      previous = self.portfolio_selector.series_covariance_get(kind, window)
+      if previous is not None and not full:
+        series = self.series_frame(kind, previous.start_date)
+        if self.extends(previous, series):
+          self.slide(previous, series)
+          return
+      self.compute(
+        kind,
+        window,
+        self.series_frame(
+          kind, self.market_selector.first_of_last_price_dates(window + 1)))
+  
+  def extends(self, previous: SeriesCovariance, series: pd.DataFrame) -> bool:
+    observations = previous.observations
+    return (
+      np.array_equal(
+        unpack_array(previous.ids, '<i8'), series.columns.to_numpy())
+      and len(series) > observations
+      and series.index[observations] == previous.date)
+  
+  def slide(self, previous: SeriesCovariance, series: pd.DataFrame) -> None:
+    returns = self.returns(series)
+    ids = series.columns.to_numpy()
+    observations = previous.observations
+    entering = returns[observations:]
+    leaving_count = max(0, len(returns) - previous.window)
+    leaving = returns[:leaving_count]
+    products = upper_triangle_take(
+      unpack_array(previous.products), len(ids), np.arange(len(ids)))
+    self.save(
+      previous.kind,
+      previous.window,
+      series.index[leaving_count],
+      series.index[-1],
+      len(returns) - leaving_count,
+      ids,
+      unpack_array(previous.sums) + entering.sum(axis=0)
+      - leaving.sum(axis=0),
+      products + entering.T @ entering - leaving.T @ leaving)
+  
+  def compute(self, kind: str, window: int, series: pd.DataFrame) -> None:
+    returns = self.returns(series)
+    start = max(0, len(returns) - window)
+    returns = returns[start:]
+    self.save(
+      kind,
+      window,
+      series.index[start] if len(series) else None,
+      series.index[-1] if len(series) else None,
+      len(returns),
+      series.columns.to_numpy(),
+      returns.sum(axis=0),
+      returns.T @ returns)
+  
+  def save(
+      self,
+      kind: str,
+      window: int,
+      start_date: date,
+      end_date: date,
+      observations: int,
+      ids: np.ndarray,
+      sums: np.ndarray,
+      products: np.ndarray) -> None:
+    if end_date is None:
+      return
+    self.portfolio_service.series_covariance_save(
+      kind,
+      window,
+      start_date,
+      end_date,
+      observations,
+      ids,
+      sums,
+      products,
+      self.portfolio_calculator.covariance(sums, products, observations))
+  
+  def returns(self, series: pd.DataFrame) -> np.ndarray:
+    ## Daily returns from the second date on, missing ones count as zero
+    returns = series.pct_change().iloc[1:].to_numpy(dtype=float)
+    return np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+  
+  def series_frame(self, kind: str, date_from: date) -> pd.DataFrame:
+    ## Prices of every asset or values of every portfolio, by date and id
+    if kind == ASSET_COVARIANCE:
+      return self.market_selector.asset_price_frame(date_from)
+    portfolio_ids = sorted(
+      portfolio.id for portfolio in self.portfolio_selector.portfolios_list())
+    values = self.portfolio_selector.portfolio_value_frames(
+      portfolio_ids, date_from, self.market_selector.last_price_date())
+    return pd.DataFrame({
+      portfolio_id: values[portfolio_id]['amount']
+      for portfolio_id in portfolio_ids}).sort_index()
 
 
 dataExtractor = DataExtractor()
@@ -253,9 +1381,19 @@ marketService = MarketService()
 
 portfolioService = PortfolioService()
 
+portfolioCalculator = PortfolioCalculator()
+
 entityLoader = EntityLoader(
   marketSelector,
   portfolioSelector,
   marketService,
-  portfolioService
-)
\ No newline at end of file
+  portfolioService,
+  portfolioCalculator
+)
+
+covarianceLoader = CovarianceLoader(
+  marketSelector,
+  portfolioSelector,
+  portfolioService,
+  portfolioCalculator
+)
@@ -1,5 +1,7 @@
 
+import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -60,13 +62,86 @@ REST_FRAMEWORK = {
 
 WSGI_APPLICATION = 'portfolioviz.wsgi.application'
 
-DATABASES = {
-    'default': {
+# 'sqlite' or 'postgres'; PostgreSQL connects with the POSTGRES_* variables
+# and loads time series through COPY FROM STDIN
+DATABASE_BACKEND = os.environ.get('PORTFOLIOVIZ_DATABASE', 'sqlite')
+
+if DATABASE_BACKEND == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'portfolioviz'),
+            'USER': os.environ.get('POSTGRES_USER', 'portfolioviz'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+
+# Opt-in SQLite profile: every connection gets SQLITE_PRAGMAS, and reads
+# outside of write transactions go to a read-only replica alias of the same
+# file, so the API keeps answering while add_initial_data writes
+SQLITE_TUNED = (
+    DATABASE_BACKEND == 'sqlite'
+    and os.environ.get('PORTFOLIOVIZ_SQLITE_TUNED', '').lower() == 'true')
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -64_000,
+    'mmap_size': 268_435_456,
+    'temp_store': 'memory',
+    'busy_timeout': 5_000,
+}
+
+SQLITE_REPLICA_ALIAS = 'replica'
+
+if SQLITE_TUNED:
+    DATABASES[SQLITE_REPLICA_ALIAS] = {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': f"file:{DATABASES['default']['NAME']}?mode=ro",
+        'TEST': {'MIRROR': 'default'},
     }
+    DATABASE_ROUTERS = ['portfolioviz.routers.ReplicaRouter']
+
+# The time_series cache holds endpoint payloads keyed by data version. It may
+# stay process-local, but the version itself has to live in a cache every
+# process sees, so that add_initial_data, recompute_quantities and
+# update_covariances invalidate the web server. A LocMemCache version only
+# works with a single process; with several hosts use e.g. RedisCache.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'time_series': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'portfolioviz-time-series',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    'time_series_version': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.data_cache' / 'versions',
+        'TIMEOUT': None,
+    },
 }
 
+TIME_SERIES_CACHE_ALIAS = 'time_series'
+
+TIME_SERIES_VERSION_CACHE_ALIAS = 'time_series_version'
+
+MATRIX_CACHE_MAX_BYTES = int(
+    os.environ.get('PORTFOLIOVIZ_MATRIX_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -110,7 +185,30 @@ STATIC_URL = '/static/'
 
 STATIC_DIR_NAME = 'portfolioviz'+STATIC_URL
 
+# Either the datos.xlsx workbook or a directory holding one Precios and one
+# weights file per sheet, as .csv or .parquet
 DATA_PATH_NAME = STATIC_DIR_NAME+"datos.xlsx"
 
+DATA_CACHE_DIR = BASE_DIR / '.data_cache'
+
 DATE_FORMAT = "%Y-%m-%d"
 
+# 'rows' keeps one Share/Weight/PortfolioValue row per asset and date,
+# 'columnar' packs them into one PortfolioSnapshot row per portfolio and date
+# and 'derived' stores only prices and quantities, computing the rest on read
+TIME_SERIES_STORAGE = 'rows'
+
+# Numeric type of the derived Share, Weight and PortfolioValue amounts:
+# 'decimal' rounds them to six decimals and 'float' keeps their float64 value.
+# Migrations create the same numeric(40, 6) columns in both modes; run
+# convert_time_series_numeric after switching to change the column type
+TIME_SERIES_NUMERIC = os.environ.get(
+    'PORTFOLIOVIZ_TIME_SERIES_NUMERIC', 'decimal').lower()
+
+if TIME_SERIES_NUMERIC not in ('decimal', 'float'):
+    raise ImproperlyConfigured(
+        f"PORTFOLIOVIZ_TIME_SERIES_NUMERIC has to be 'decimal' or 'float', "
+        f"not {TIME_SERIES_NUMERIC!r}")
+
+# Serve the read API from its async views, for ASGI servers such as uvicorn
+ASYNC_VIEWS = os.environ.get('PORTFOLIOVIZ_ASYNC_VIEWS', '').lower() == 'true'
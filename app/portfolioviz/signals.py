@@ -1,6 +1,25 @@
+from django.db.backends.signals import connection_created
 from django.db.models.signals import post_migrate
 from django.dispatch import receiver
+from portfolioviz.settings import (
+    SQLITE_PRAGMAS,
+    SQLITE_REPLICA_ALIAS,
+    SQLITE_TUNED
+)
 
 @receiver(post_migrate)
 def create_instances(sender, **kwargs):
-    pass
\ No newline at end of file
+    pass
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    if SQLITE_TUNED and connection.vendor == 'sqlite':
+        apply_sqlite_pragmas(connection, SQLITE_PRAGMAS)
+
+def apply_sqlite_pragmas(connection, pragmas):
+    for pragma, value in pragmas.items():
+        ## Switching the journal mode writes to the file, which the
+        ## read-only replica cannot do
+        if pragma == 'journal_mode' and connection.alias == SQLITE_REPLICA_ALIAS:
+            continue
+        connection.connection.execute(f'PRAGMA {pragma} = {value}')
@@ -1,19 +1,1189 @@
+import tempfile
 import unittest
-from portfolioviz.selectors import MarketInformationService
+from unittest import mock
+from datetime import date
+from decimal import Decimal
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+import numpy as np
+import orjson
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import BadRequest
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import (
+  AsyncRequestFactory,
+  RequestFactory,
+  TestCase,
+  override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from portfolioviz.cache import matrixCache, timeSeriesCache
+from portfolioviz.constants import (
+  ASSET_COVARIANCE,
+  COLUMNAR_STORAGE,
+  DECIMAL_NUMERIC,
+  DERIVED_STORAGE,
+  FLOAT_NUMERIC,
+  PORTFOLIO_COVARIANCE,
+  ROW_STORAGE
+)
+from portfolioviz.models import (
+  Asset,
+  Portfolio,
+  PortfolioSnapshot,
+  PortfolioValue,
+  PortfolioValueRollup,
+  Price,
+  Quantity,
+  Share,
+  Weight,
+  WeightRollup
+)
+from portfolioviz import fields
+from portfolioviz.profiling import LoadProfiler
+from portfolioviz.routers import ReplicaRouter
+from portfolioviz.selectors import MarketInformationSelector, portfolioSelector
+from portfolioviz import views
+from portfolioviz.signals import apply_sqlite_pragmas
+from portfolioviz.services import (
+  DataExtractor,
+  EntityLoader,
+  RawPortfolioData,
+  SyntheticDataExtractor,
+  copy_csv,
+  covarianceLoader,
+  entityLoader,
+  marketSelector,
+  marketService,
+  portfolioCalculator,
+  portfolioService
+)
 
 
-class MarketInformationServiceTest(unittest.TestCase):
+## The version cache is shared with running servers, so tests get their own
+version_directory = tempfile.TemporaryDirectory()
+version_settings = override_settings(CACHES={
+  **settings.CACHES,
+  "time_series_version": {
+    **settings.CACHES["time_series_version"],
+    "LOCATION": version_directory.name}})
+
+def setUpModule():
+  version_settings.enable()
+
+def tearDownModule():
+  version_settings.disable()
+  version_directory.cleanup()
+
+def build_raw_data():
+  dates = list(pd.to_datetime(["2022-02-14", "2022-02-15", "2022-02-16"]))
+  prices = pd.DataFrame(
+    {"A": [10.0, 20.0, 5.0], "B": [2.0, 2.0, 4.0]},
+    index=pd.Index(dates, name="Dates"))
+  initial_weights = pd.DataFrame(
+    {"P1": [0.5, 0.5], "P2": [0.2, 0.8]},
+    index=pd.MultiIndex.from_tuples(
+      [(dates[0], "A"), (dates[0], "B")], names=["Fecha", "activos"]))
+  return RawPortfolioData(
+    ["A", "B"],
+    ["P1", "P2"],
+    initial_weights,
+    prices,
+    dates,
+    dates[0],
+    1000)
+
+
+class MarketInformationSelectorTest(TestCase):
   
+  def setUp(self):
+    entityLoader.populate_db(SyntheticDataExtractor(4, 3, 5).extract_data())
   
   def test_fetch_all_assets(self):
-    pass
+    self.assertEqual(
+      [asset.name for asset in marketSelector.assets_list()],
+      ["ASSET_0", "ASSET_1", "ASSET_2", "ASSET_3"])
   
   def test_fetch_all_portoflios(self):
-    pass
+    self.assertEqual(portfolioSelector.portfolios_list().count(), 3)
+  
+  def test_fetch_marketInformationSelector(self):
+    self.assertIs(MarketInformationSelector(), marketSelector)
+
+
+class PortfolioCalculatorTest(unittest.TestCase):
+  
+  def test_compute_matrices(self):
+    computed = portfolioCalculator.compute(build_raw_data())
+    
+    self.assertEqual(computed.quantities.shape, (2, 3, 2))
+    self.assertAlmostEqual(computed.quantities[0, 2, 0], 50.0)
+    self.assertAlmostEqual(computed.quantities[1, 1, 1], 400.0)
+    self.assertAlmostEqual(computed.shares[0, 1, 0], 1000.0)
+    self.assertAlmostEqual(computed.values[0, 1], 1500.0)
+    self.assertAlmostEqual(computed.weights[1, 2, 1], 1600.0 / 1700.0)
+    self.assertTrue((abs(computed.weights.sum(axis=2) - 1) < 1e-12).all())
+  
+  def test_transactions_apply_from_next_date(self):
+    raw_data = build_raw_data()
+    transactions = np.zeros((2, 3, 2))
+    transactions[0, 0, 0] = 10
+    transactions[0, 1, 1] = -100
+    
+    computed = portfolioCalculator.compute_from_quantities(
+      raw_data,
+      portfolioCalculator.initial_quantity_matrix(raw_data),
+      transactions)
+    
+    np.testing.assert_allclose(computed.quantities[0, :, 0], [50, 60, 60])
+    np.testing.assert_allclose(computed.quantities[0, :, 1], [250, 250, 150])
+    np.testing.assert_allclose(
+      computed.quantities[1],
+      portfolioCalculator.compute(raw_data).quantities[1])
+
+
+class DataExtractorTest(unittest.TestCase):
+  
+  def setUp(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.data_path = Path(directory.name) / "datos"
+    self.data_path.mkdir()
+    raw_data = build_raw_data()
+    raw_data.prices.to_csv(self.data_path / "Precios.csv")
+    raw_data.initial_weights.to_csv(self.data_path / "weights.csv")
+    self.extractor = DataExtractor(
+      self.data_path, Path(directory.name) / "cache")
+  
+  def test_extracts_csv_directory_through_cache(self):
+    first = self.extractor.extract_data()
+    second = self.extractor.extract_data()
+    
+    self.assertEqual(len(list(self.extractor.cache_dir.iterdir())), 1)
+    self.assertEqual(second.assets, ["A", "B"])
+    self.assertEqual(second.portfolios, ["P1", "P2"])
+    self.assertEqual(second.dates, first.dates)
+    self.assertEqual(second.initial_date, pd.Timestamp("2022-02-14"))
+    pd.testing.assert_frame_equal(second.prices, build_raw_data().prices)
+    self.assertAlmostEqual(
+      second.initial_weights.loc[(second.initial_date, "B")]["P2"], 0.8)
+  
+  def test_extracts_parquet_directory(self):
+    raw_data = build_raw_data()
+    raw_data.prices.to_parquet(self.data_path / "Precios.parquet")
+    raw_data.initial_weights.reset_index(level="activos").to_parquet(
+      self.data_path / "weights.parquet")
+    
+    extracted = self.extractor.extract_data()
+    
+    self.assertEqual(extracted.assets, ["A", "B"])
+    self.assertEqual(extracted.portfolios, ["P1", "P2"])
+    self.assertEqual(extracted.dates, raw_data.dates)
+    pd.testing.assert_frame_equal(extracted.prices, raw_data.prices)
+    pd.testing.assert_frame_equal(
+      extracted.initial_weights, raw_data.initial_weights)
+  
+  def test_skips_blank_csv_lines(self):
+    with open(self.data_path / "Precios.csv", "a") as csv_file:
+      csv_file.write("\n\n")
+    
+    raw_data = self.extractor.extract_data()
+    
+    self.assertEqual(len(raw_data.dates), 3)
+    pd.testing.assert_frame_equal(raw_data.prices, build_raw_data().prices)
+
+
+class EntityLoaderTest(TestCase):
+  
+  def test_populate_db(self):
+    entityLoader.populate_db(build_raw_data())
+    
+    self.assertEqual(Quantity.objects.count(), 12)
+    self.assertEqual(Weight.objects.count(), 12)
+    value = PortfolioValue.objects.get(
+      portfolio__name="P2", date="2022-02-16")
+    self.assertAlmostEqual(float(value.amount), 1700.0)
+  
+  def test_append_rejects_unknown_entities(self):
+    raw_data = build_raw_data()
+    entityLoader.populate_db(replace(
+      raw_data, prices=raw_data.prices.iloc[:2], dates=raw_data.dates[:2]))
+    
+    with self.assertRaisesMessage(ValueError, "['C']"):
+      entityLoader.append(replace(
+        raw_data,
+        assets=["A", "B", "C"],
+        prices=raw_data.prices.assign(C=1.0)))
+    with self.assertRaisesMessage(ValueError, "['P3']"):
+      entityLoader.append(replace(raw_data, portfolios=["P1", "P2", "P3"]))
+    self.assertEqual(Price.objects.count(), 4)
+  
+  def test_append_rejects_missing_entities(self):
+    raw_data = build_raw_data()
+    entityLoader.populate_db(replace(
+      raw_data, prices=raw_data.prices.iloc[:2], dates=raw_data.dates[:2]))
+    
+    with self.assertRaisesMessage(ValueError, "assets ['B']"):
+      entityLoader.append(replace(
+        raw_data,
+        assets=["A"],
+        initial_weights=raw_data.initial_weights.iloc[:1],
+        prices=raw_data.prices[["A"]]))
+    with self.assertRaisesMessage(ValueError, "portfolios ['P2']"):
+      entityLoader.append(replace(
+        raw_data,
+        portfolios=["P1"],
+        initial_weights=raw_data.initial_weights[["P1"]]))
+    self.assertEqual(Price.objects.count(), 4)
+    self.assertEqual(Quantity.objects.count(), 8)
+  
+  def test_profile_load_stages(self):
+    profiler = LoadProfiler(enabled=True)
+    loader = EntityLoader(
+      marketSelector,
+      portfolioSelector,
+      marketService,
+      portfolioService,
+      portfolioCalculator,
+      profiler=profiler)
+    
+    loader.populate_db(build_raw_data(), chunk_size=2)
+    
+    stages = {stage["name"]: stage for stage in profiler.report()}
+    self.assertEqual(stages["prices_load"]["calls"], 2)
+    self.assertEqual(stages["prices_load"]["rows"], 6)
+    self.assertEqual(stages["weights_load_all_periods"]["rows"], 12)
+    self.assertGreater(stages["weights_load_all_periods"]["queries"], 0)
+    self.assertGreater(stages["share_load_all_periods"]["peak_memory_bytes"], 0)
+  
+  def test_populate_db_in_chunks(self):
+    entityLoader.populate_db(build_raw_data(), chunk_size=2)
+    
+    self.assertEqual(Quantity.objects.count(), 12)
+    self.assertEqual(
+      Quantity.objects.filter(date="2022-02-16", portfolio__name="P2").get(
+        asset__name="B").amount, 400)
+    value = PortfolioValue.objects.get(
+      portfolio__name="P2", date="2022-02-16")
+    self.assertAlmostEqual(float(value.amount), 1700.0)
+  
+  def test_apply_transactions_recomputes_later_dates(self):
+    entityLoader.populate_db(build_raw_data(), chunk_size=1)
+    portfolio = Portfolio.objects.get(name="P1")
+    asset = Asset.objects.get(name="A")
+    
+    entityLoader.apply_transactions(
+      [(portfolio, asset, date(2022, 2, 14), 10)], chunk_size=1)
+    
+    quantities = Quantity.objects.filter(
+      portfolio=portfolio, asset=asset).order_by("date")
+    self.assertEqual(
+      [float(quantity.amount) for quantity in quantities], [50, 60, 60])
+    self.assertEqual(Quantity.objects.count(), 12)
+    value = PortfolioValue.objects.get(portfolio=portfolio, date="2022-02-16")
+    self.assertAlmostEqual(float(value.amount), 60 * 5.0 + 250 * 4.0)
+    other = PortfolioValue.objects.get(portfolio__name="P2", date="2022-02-16")
+    self.assertAlmostEqual(float(other.amount), 1700.0)
+  
+  def test_recompute_reads_prices_from_previous_date(self):
+    entityLoader.populate_db(build_raw_data())
+    
+    with mock.patch.object(
+        marketSelector,
+        "price_frame",
+        wraps=marketSelector.price_frame) as price_frame:
+      entityLoader.recompute_from(date(2022, 2, 16))
+    
+    price_frame.assert_called_once_with(date(2022, 2, 15))
+    self.assertEqual(Quantity.objects.count(), 12)
+    value = PortfolioValue.objects.get(portfolio__name="P2", date="2022-02-16")
+    self.assertAlmostEqual(float(value.amount), 1700.0)
+  
+  def test_append_new_dates(self):
+    raw_data = build_raw_data()
+    entityLoader.populate_db(replace(
+      raw_data, prices=raw_data.prices.iloc[:2], dates=raw_data.dates[:2]))
+    
+    entityLoader.append(raw_data)
+    entityLoader.append(raw_data)
+    
+    self.assertEqual(Quantity.objects.count(), 12)
+    self.assertEqual(Price.objects.count(), 6)
+    value = PortfolioValue.objects.get(
+      portfolio__name="P2", date="2022-02-16")
+    self.assertAlmostEqual(float(value.amount), 1700.0)
+
+
+class ColumnarStorageTest(TestCase):
+  
+  def setUp(self):
+    EntityLoader(
+      marketSelector,
+      portfolioSelector,
+      marketService,
+      portfolioService,
+      portfolioCalculator,
+      COLUMNAR_STORAGE).populate_db(build_raw_data())
+    self.addCleanup(
+      setattr,
+      portfolioSelector,
+      'time_series_storage',
+      portfolioSelector.time_series_storage)
+    portfolioSelector.time_series_storage = COLUMNAR_STORAGE
+  
+  def test_packs_one_row_per_portfolio_and_date(self):
+    self.assertEqual(PortfolioSnapshot.objects.count(), 6)
+    self.assertFalse(Weight.objects.exists())
+  
+  def test_selectors_read_snapshots(self):
+    portfolio = Portfolio.objects.get(name="P2")
+    
+    values = portfolioSelector.portfolio_value_frame(portfolio.id, None, None)
+    weights = portfolioSelector.weight_frame(portfolio.id, None, None)
+    
+    self.assertAlmostEqual(values["amount"].iloc[2], 1700.0)
+    self.assertEqual(weights.shape, (3, 2))
+    self.assertAlmostEqual(weights["B"].iloc[2], 1600.0 / 1700.0)
+  
+  def test_snapshots_follow_asset_ids(self):
+    portfolio = Portfolio.objects.get(name="P2")
+    Asset.objects.create(name="C")
+    
+    weights = portfolioSelector.weight_frame(portfolio.id, None, None)
+    
+    self.assertEqual(weights.columns.tolist(), ["A", "B", "C"])
+    self.assertTrue(weights["C"].isna().all())
+    Asset.objects.filter(name="C").delete()
+    Asset.objects.filter(name="B").delete()
+    with self.assertRaises(ValueError):
+      portfolioSelector.weight_frame(portfolio.id, None, None)
+
+
+class PortfolioServiceBulkTest(TestCase):
+  
+  def test_prices_bulk_create_in_batches(self):
+    marketService.assets_bulk_create(["A"])
+    asset = Asset.objects.get(name="A")
+    dates = pd.date_range("2022-02-14", periods=5)
+    
+    created = portfolioService.prices_bulk_create(
+      ((float(i), asset, dt.date()) for i, dt in enumerate(dates)),
+      batch_size=2)
+    
+    self.assertEqual(created, 5)
+    self.assertEqual(Price.objects.filter(asset=asset).count(), 5)
+  
+  def test_rejects_non_positive_batch_sizes(self):
+    with self.assertRaises(ValueError):
+      portfolioService.prices_bulk_create([], batch_size=0)
+    with self.assertRaises(CommandError):
+      call_command("add_initial_data", "--batch-size", "0")
+  
+  def test_copy_csv_rows(self):
+    asset = Asset.objects.create(name="A")
+    portfolio = Portfolio.objects.create(name="P1")
+    
+    prices = copy_csv(
+      connection,
+      [Price._meta.get_field(name) for name in ["amount", "asset", "date"]],
+      [Price(asset=asset, date=date(2022, 2, 14), amount=10.5)])
+    snapshots = copy_csv(
+      connection,
+      [
+        PortfolioSnapshot._meta.get_field(name)
+        for name in ["portfolio", "shares"]],
+      [PortfolioSnapshot(portfolio=portfolio, shares=b"\x01\xff")])
+    
+    self.assertEqual(
+      prices.getvalue(), f"10.500000,{asset.id},2022-02-14\r\n")
+    self.assertEqual(snapshots.getvalue(), f"{portfolio.id},\\x01ff\r\n")
+  
+  def test_prices_are_unique_per_asset_and_date(self):
+    marketService.assets_bulk_create(["A"])
+    asset = Asset.objects.get(name="A")
+    portfolioService.price_create(1.0, asset, "2022-02-14")
+    
+    with self.assertRaises(IntegrityError):
+      portfolioService.price_create(2.0, asset, "2022-02-14")
+
+
+class DerivedStorageTest(TestCase):
+  
+  def setUp(self):
+    EntityLoader(
+      marketSelector,
+      portfolioSelector,
+      marketService,
+      portfolioService,
+      portfolioCalculator,
+      DERIVED_STORAGE).populate_db(build_raw_data())
+    self.addCleanup(
+      setattr,
+      portfolioSelector,
+      'time_series_storage',
+      portfolioSelector.time_series_storage)
+    portfolioSelector.time_series_storage = DERIVED_STORAGE
+  
+  def test_materializes_only_quantities(self):
+    self.assertEqual(Quantity.objects.count(), 12)
+    self.assertFalse(Weight.objects.exists())
+    self.assertFalse(PortfolioValue.objects.exists())
+  
+  def test_selectors_derive_values_and_weights(self):
+    portfolio = Portfolio.objects.get(name="P2")
+    
+    values = portfolioSelector.portfolio_value_frame(portfolio.id, None, None)
+    weights = portfolioSelector.weight_frame(portfolio.id, None, None)
+    
+    self.assertEqual(len(values), 3)
+    self.assertAlmostEqual(values["amount"].iloc[2], 1700.0)
+    self.assertEqual(weights.shape, (3, 2))
+    self.assertAlmostEqual(weights["B"].iloc[2], 1600.0 / 1700.0)
+
+
+class RollupTest(TestCase):
+  
+  def test_populate_db_builds_rollups(self):
+    entityLoader.populate_db(build_raw_data())
+    
+    rollup = PortfolioValueRollup.objects.get(
+      portfolio__name="P2", resolution="week")
+    self.assertEqual(str(rollup.date), "2022-02-16")
+    self.assertAlmostEqual(float(rollup.last), 1700.0)
+    self.assertAlmostEqual(float(rollup.mean), 1300.0)
+    self.assertAlmostEqual(float(rollup.min), 1000.0)
+    self.assertAlmostEqual(float(rollup.max), 1700.0)
+    self.assertEqual(WeightRollup.objects.count(), 8)
+  
+  def test_append_rebuilds_open_periods(self):
+    raw_data = build_raw_data()
+    entityLoader.populate_db(replace(
+      raw_data, prices=raw_data.prices.iloc[:2], dates=raw_data.dates[:2]))
+    
+    entityLoader.append(raw_data)
+    
+    self.assertEqual(PortfolioValueRollup.objects.count(), 4)
+    rollup = PortfolioValueRollup.objects.get(
+      portfolio__name="P2", resolution="month")
+    self.assertAlmostEqual(float(rollup.last), 1700.0)
+    self.assertAlmostEqual(float(rollup.mean), 1300.0)
+  
+  def test_rollups_come_from_computed_chunks(self):
+    raw_data = SyntheticDataExtractor(2, 1, 1500).extract_data()
+    
+    with mock.patch.object(
+        portfolioSelector,
+        "share_frame",
+        wraps=portfolioSelector.share_frame) as share_frame:
+      entityLoader.populate_db(raw_data, chunk_size=100)
+    
+    share_frame.assert_not_called()
+    rollup = PortfolioValueRollup.objects.filter(
+      resolution="week").latest("date")
+    self.assertEqual(rollup.date, raw_data.dates[-1].date())
+  
+  def test_chunks_write_closed_periods(self):
+    raw_data = SyntheticDataExtractor(3, 2, 90).extract_data()
+    entityLoader.populate_db(raw_data)
+    expected_values, expected_weights = self.rollup_rows()
+    
+    for load in [
+        lambda: entityLoader.populate_db(raw_data, chunk_size=7),
+        lambda: (
+          entityLoader.populate_db(
+            replace(raw_data, dates=raw_data.dates[:40]), chunk_size=7),
+          entityLoader.append(raw_data, chunk_size=7))]:
+      Portfolio.objects.all().delete()
+      Asset.objects.all().delete()
+      with mock.patch.object(
+          portfolioService,
+          "portfolio_value_rollups_bulk_create",
+          wraps=portfolioService.portfolio_value_rollups_bulk_create
+      ) as bulk_create:
+        load()
+      values, weights = self.rollup_rows()
+      
+      self.assertGreater(bulk_create.call_count, 90 // 7)
+      self.assertEqual(
+        [row[:3] for row in values], [row[:3] for row in expected_values])
+      ## Appends read the start of an open period back from stored quantities
+      np.testing.assert_allclose(
+        [row[3:] for row in values],
+        [row[3:] for row in expected_values],
+        rtol=1e-8)
+      self.assertEqual(
+        [row[:4] for row in weights], [row[:4] for row in expected_weights])
+      np.testing.assert_allclose(
+        [row[4] for row in weights],
+        [row[4] for row in expected_weights],
+        rtol=1e-12)
+  
+  def rollup_rows(self):
+    values = PortfolioValueRollup.objects.order_by(
+      "portfolio__name", "resolution", "date").values_list(
+      "portfolio__name", "resolution", "date", "last", "mean", "min", "max")
+    weights = WeightRollup.objects.order_by(
+      "portfolio__name", "resolution", "date", "asset__name").values_list(
+      "portfolio__name", "resolution", "date", "asset__name", "amount")
+    return (
+      [row[:3] + tuple(map(float, row[3:])) for row in values],
+      [row[:4] + (float(row[4]),) for row in weights])
+  
+  def test_resolution_query_param(self):
+    caches[timeSeriesCache.alias].clear()
+    entityLoader.populate_db(build_raw_data())
+    portfolio = Portfolio.objects.get(name="P2")
+    url = f"/portfolio/{portfolio.id}"
+    
+    values = self.client.get(f"{url}/value?resolution=week").json()
+    weights = self.client.get(f"{url}/weights?resolution=month").json()
+    
+    self.assertEqual(len(values["values"]), 1)
+    self.assertAlmostEqual(float(values["values"][0]["amount"]), 1700.0)
+    self.assertAlmostEqual(weights["weights"][0]["B"], 1600.0 / 1700.0, 6)
+    self.assertEqual(
+      self.client.get(f"{url}/value?resolution=year").status_code, 400)
+
+
+class ResponseFormatTest(TestCase):
+  
+  def setUp(self):
+    caches[timeSeriesCache.alias].clear()
+    entityLoader.populate_db(build_raw_data())
+    self.url = f"/portfolio/{Portfolio.objects.get(name='P2').id}"
+  
+  def test_rows_format(self):
+    with self.assertNumQueries(2):
+      weights = self.client.get(f"{self.url}/weights").json()["weights"]
+    values = self.client.get(f"{self.url}/value").json()["values"]
+    
+    self.assertEqual(
+      weights[2], {"date": "2022-02-16", "A": 0.058824, "B": 0.941176})
+    self.assertEqual(values[2], {"amount": "1700.000000", "date": "2022-02-16"})
+  
+  def test_columns_format(self):
+    weights = self.client.get(f"{self.url}/weights?format=columns").json()
+    values = self.client.get(f"{self.url}/value?format=columns").json()
+    
+    self.assertEqual(weights["assets"], ["A", "B"])
+    self.assertEqual(weights["weights"][2], [0.058824, 0.941176])
+    self.assertEqual(values["dates"], ["2022-02-14", "2022-02-15", "2022-02-16"])
+    self.assertEqual(values["values"], [1000.0, 1200.0, 1700.0])
+    self.assertEqual(
+      self.client.get(f"{self.url}/value?format=csv").status_code, 400)
+  
+  def test_empty_range(self):
+    response = self.client.get(f"{self.url}/weights?from=2023-01-01").json()
+    
+    self.assertEqual(response["weights"], [])
+
+
+class PortfolioSeriesBatchTest(TestCase):
+  
+  def setUp(self):
+    caches[timeSeriesCache.alias].clear()
+    entityLoader.populate_db(build_raw_data())
+    self.ids = ",".join(
+      str(portfolio.id) for portfolio in Portfolio.objects.order_by("name"))
+  
+  def test_one_query_per_metric(self):
+    with self.assertNumQueries(3):
+      response = self.client.get(f"/portfolios/series?ids={self.ids}").json()
+    
+    self.assertEqual(
+      [portfolio["name"] for portfolio in response["portfolios"]],
+      ["P1", "P2"])
+    self.assertEqual(
+      response["portfolios"][1]["values"][2]["amount"], "1700.000000")
+    self.assertEqual(len(response["portfolios"][0]["weights"]), 3)
+  
+  def test_columns_format_in_derived_storage(self):
+    self.addCleanup(
+      setattr,
+      portfolioSelector,
+      'time_series_storage',
+      portfolioSelector.time_series_storage)
+    portfolioSelector.time_series_storage = DERIVED_STORAGE
+    
+    response = self.client.get(
+      f"/portfolios/series?ids={self.ids}&metrics=weights&format=columns").json()
+    
+    p2 = response["portfolios"][1]
+    self.assertNotIn("values", p2)
+    self.assertEqual(p2["assets"], ["A", "B"])
+    self.assertAlmostEqual(p2["weights"][2][1], 1600.0 / 1700.0)
+  
+  def test_rejects_unknown_portfolios(self):
+    self.assertEqual(
+      self.client.get("/portfolios/series?ids=999").status_code, 404)
+    self.assertEqual(
+      self.client.get("/portfolios/series?ids=abc").status_code, 400)
+
+
+class AsyncViewsTest(TestCase):
+  
+  def setUp(self):
+    caches[timeSeriesCache.alias].clear()
+    entityLoader.populate_db(build_raw_data())
+    self.portfolio = Portfolio.objects.get(name="P2")
+    self.factory = AsyncRequestFactory()
+  
+  async def test_match_sync_views(self):
+    url = f"/portfolio/{self.portfolio.id}/weights?from=2022-02-15"
+    
+    weights = await views.get_weights_async(
+      self.factory.get(url), str(self.portfolio.id))
+    assets = await views.get_assets_async(self.factory.get("/assets/"))
+    
+    expected = await sync_to_async(views.get_weights)(
+      self.factory.get(url), str(self.portfolio.id))
+    self.assertEqual(weights.content, expected.content)
+    self.assertEqual(len(orjson.loads(assets.content)["instances"]), 2)
+  
+  async def test_rejects_other_methods(self):
+    response = await views.get_portfolios_async(
+      self.factory.post("/portfolios/"))
+    
+    self.assertEqual(response.status_code, 405)
+
+
+class StreamingResponseTest(TestCase):
+  
+  def setUp(self):
+    caches[timeSeriesCache.alias].clear()
+    entityLoader.populate_db(build_raw_data())
+    self.url = f"/portfolio/{Portfolio.objects.get(name='P2').id}"
+  
+  def test_json_stream_matches_response(self):
+    self.addCleanup(
+      setattr,
+      portfolioSelector,
+      'time_series_storage',
+      portfolioSelector.time_series_storage)
+    for storage in [ROW_STORAGE, DERIVED_STORAGE]:
+      with self.subTest(storage=storage):
+        caches[timeSeriesCache.alias].clear()
+        portfolioSelector.time_series_storage = storage
+        for path in ["value", "weights", "value?resolution=week"]:
+          response = self.client.get(f"{self.url}/{path}")
+          streamed = self.client.get(
+            f"{self.url}/{path}{'&' if '?' in path else '?'}stream=json")
+          
+          self.assertTrue(streamed.streaming)
+          self.assertEqual(
+            orjson.loads(b"".join(streamed.streaming_content)),
+            response.json())
+  
+  def test_float_mode_streams_numbers(self):
+    self.addCleanup(
+      setattr,
+      portfolioSelector,
+      'time_series_storage',
+      portfolioSelector.time_series_storage)
+    for storage in [ROW_STORAGE, COLUMNAR_STORAGE, DERIVED_STORAGE]:
+      with self.subTest(storage=storage), mock.patch.object(
+          fields, "TIME_SERIES_NUMERIC", FLOAT_NUMERIC):
+        Portfolio.objects.all().delete()
+        Asset.objects.all().delete()
+        EntityLoader(
+          marketSelector,
+          portfolioSelector,
+          marketService,
+          portfolioService,
+          portfolioCalculator,
+          storage).populate_db(build_raw_data())
+        caches[timeSeriesCache.alias].clear()
+        portfolioSelector.time_series_storage = storage
+        url = f"/portfolio/{Portfolio.objects.get(name='P2').id}"
+        for path in ["value?resolution=day", "value?resolution=week"]:
+          response = self.client.get(f"{url}/{path}").json()
+          streamed = orjson.loads(b"".join(
+            self.client.get(f"{url}/{path}&stream=json").streaming_content))
+          
+          self.assertEqual(len(streamed["values"]), len(response["values"]))
+          for streamed_row, row in zip(streamed["values"], response["values"]):
+            self.assertEqual(streamed_row.keys(), row.keys())
+            for column in row.keys() - {"date"}:
+              self.assertIsInstance(streamed_row[column], float)
+              self.assertIsInstance(row[column], float)
+              self.assertAlmostEqual(streamed_row[column], row[column])
+  
+  def test_ndjson_stream(self):
+    response = self.client.get(f"{self.url}/weights?stream=ndjson")
+    
+    lines = b"".join(response.streaming_content).splitlines()
+    self.assertEqual(response["Content-Type"], "application/x-ndjson")
+    self.assertEqual(len(lines), 3)
+    self.assertEqual(
+      orjson.loads(lines[2]),
+      {"date": "2022-02-16", "A": 0.058824, "B": 0.941176})
+    self.assertEqual(
+      self.client.get(f"{self.url}/value?stream=csv").status_code, 400)
+
+
+class SqliteTuningTest(TestCase):
+  
+  def test_apply_pragmas(self):
+    apply_sqlite_pragmas(connection, {"cache_size": -2_000, "busy_timeout": 50})
+    
+    with connection.cursor() as cursor:
+      self.assertEqual(
+        cursor.execute("PRAGMA cache_size").fetchone()[0], -2_000)
+      self.assertEqual(cursor.execute("PRAGMA busy_timeout").fetchone()[0], 50)
+  
+  def test_router_reads_from_replica_outside_transactions(self):
+    router = ReplicaRouter()
+    
+    self.assertEqual(router.db_for_read(Price), "default")
+    self.assertEqual(router.db_for_write(Price), "default")
+    with mock.patch.object(connection, "in_atomic_block", False):
+      self.assertEqual(router.db_for_read(Price), "replica")
+
+
+class MatrixCacheTest(TestCase):
+  
+  def setUp(self):
+    entityLoader.populate_db(build_raw_data())
+    timeSeriesCache.invalidate()
+    self.portfolio = Portfolio.objects.get(name="P2")
+    self.asset = Asset.objects.get(name="B")
+  
+  def test_point_and_range_lookups(self):
+    matrixCache.warm([self.portfolio.id])
+    
+    with self.assertNumQueries(0):
+      price = matrixCache.price(self.asset.id, date(2022, 2, 16))
+      quantity = matrixCache.quantity(
+        self.portfolio.id, self.asset.id, date(2022, 2, 16))
+      shares = matrixCache.shares(
+        self.portfolio.id, date(2022, 2, 15), None)
+    
+    self.assertEqual(price, 4.0)
+    self.assertAlmostEqual(price * quantity, 1600.0)
+    self.assertIsNone(matrixCache.price(self.asset.id, date(2022, 2, 17)))
+    self.assertEqual(len(shares), 2)
+    self.assertAlmostEqual(shares[self.asset.id].iloc[1], 1600.0)
+  
+  def test_selectors_read_through_matrices(self):
+    self.addCleanup(
+      setattr,
+      portfolioSelector,
+      'time_series_storage',
+      portfolioSelector.time_series_storage)
+    portfolioSelector.time_series_storage = DERIVED_STORAGE
+    expected = portfolioSelector.share_frame(self.portfolio, None, None)
+    
+    with mock.patch.object(
+        portfolioSelector, 'uses_matrix_cache', return_value=True):
+      shares = portfolioSelector.share_frame(self.portfolio, None, None)
+      weights = portfolioSelector.weight_frame(self.portfolio.id, None, None)
+    
+    pd.testing.assert_frame_equal(shares, expected, check_names=False)
+    self.assertAlmostEqual(weights["B"].iloc[2], 1600.0 / 1700.0)
+  
+  def test_evicts_least_recently_used(self):
+    first, second = Portfolio.objects.order_by('name')
+    max_bytes = (
+      matrixCache.prices().nbytes + matrixCache.quantities(first.id).nbytes)
+    matrixCache.invalidate()
+    
+    with mock.patch.object(matrixCache, 'max_bytes', max_bytes):
+      matrixCache.prices()
+      matrixCache.quantities(first.id)
+      matrixCache.quantities(second.id)
+    
+    self.assertLessEqual(matrixCache.nbytes, max_bytes)
+    self.assertEqual(
+      list(matrixCache.entries),
+      [('quantities', first.id), ('quantities', second.id)])
+  
+  def test_data_version_invalidates(self):
+    matrixCache.prices()
+    
+    timeSeriesCache.invalidate()
+    
+    with CaptureQueriesContext(connection) as queries:
+      matrixCache.prices()
+    self.assertEqual(len(queries.captured_queries), 1)
+  
+  def test_oversized_matrices_are_not_loaded(self):
+    prices_bytes = matrixCache.prices().nbytes
+    matrixCache.invalidate()
+    
+    with mock.patch.object(matrixCache, 'max_bytes', prices_bytes - 1):
+      self.assertFalse(matrixCache.fits())
+      with self.assertNumQueries(0):
+        self.assertFalse(matrixCache.fits())
+    with mock.patch.object(matrixCache, 'max_bytes', prices_bytes):
+      self.assertTrue(matrixCache.fits([self.portfolio.id]))
+    
+    self.assertEqual(matrixCache.nbytes, 0)
+
+
+class SimulationTest(TestCase):
+  
+  def setUp(self):
+    entityLoader.populate_db(build_raw_data())
+    self.url = "/portfolios/simulate"
+  
+  def simulate(self, payload):
+    return self.client.post(
+      self.url, orjson.dumps(payload), content_type="application/json")
+  
+  def test_simulates_candidate_weights_without_writes(self):
+    payload = {
+      "weights": [
+        {"Fecha": "2022-02-14", "activos": "A", "C1": 0.5, "C2": 1.0},
+        {"Fecha": "2022-02-14", "activos": "B", "C1": 0.5, "C2": 0.0}],
+      "initial_value": 1000,
+      "format": "columns"}
+    
+    with self.assertNumQueries(1):
+      response = self.simulate(payload)
+    
+    portfolios = response.json()["portfolios"]
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual([portfolio["name"] for portfolio in portfolios], ["C1", "C2"])
+    self.assertEqual(portfolios[0]["values"], [1000.0, 1500.0, 1250.0])
+    self.assertEqual(portfolios[0]["assets"], ["A", "B"])
+    self.assertEqual(portfolios[0]["weights"][2], [0.2, 0.8])
+    self.assertEqual(portfolios[1]["values"], [1000.0, 2000.0, 500.0])
+    self.assertFalse(Portfolio.objects.filter(name="C1").exists())
+  
+  def test_starts_at_the_first_date_of_the_range(self):
+    response = self.simulate({
+      "weights": [{"activos": "A", "C1": 0.5}, {"activos": "B", "C1": 0.5}],
+      "initial_value": 1000,
+      "from": "2022-02-15"})
+    
+    values = response.json()["portfolios"][0]["values"]
+    self.assertEqual(
+      values,
+      [
+        {"amount": "1000.000000", "date": "2022-02-15"},
+        {"amount": "1125.000000", "date": "2022-02-16"}])
+  
+  def test_rejects_invalid_simulations(self):
+    unknown = self.simulate({"weights": [{"activos": "Z", "C1": 1.0}]})
+    malformed = self.client.post(
+      self.url, b"{", content_type="application/json")
+    
+    self.assertEqual(unknown.status_code, 400)
+    self.assertEqual(malformed.status_code, 400)
+    self.assertEqual(self.client.get(self.url).status_code, 405)
+  
+  def test_rejects_invalid_weights(self):
+    negative = self.simulate({"weights": [
+      {"activos": "A", "C1": 1.5}, {"activos": "B", "C1": -0.5}]})
+    unbalanced = self.simulate({"weights": [
+      {"activos": "A", "C1": 0.5}, {"activos": "B", "C1": 0.4}]})
+    
+    self.assertEqual(negative.status_code, 400)
+    self.assertEqual(unbalanced.status_code, 400)
+  
+  def test_checks_the_date_range_first(self):
+    with self.assertRaisesMessage(BadRequest, "No prices in the date range"):
+      views.simulate_rebalance(RequestFactory().post(
+        self.url,
+        orjson.dumps({
+          "weights": [{"activos": "Z", "C1": 1.0}],
+          "from": "2030-01-01"}),
+        content_type="application/json"))
+
+
+class AnalyticsTest(TestCase):
+  
+  def setUp(self):
+    caches[timeSeriesCache.alias].clear()
+    entityLoader.populate_db(build_raw_data())
+    self.portfolio = Portfolio.objects.get(name="P2")
+    self.url = f"/portfolio/{self.portfolio.id}/analytics"
+  
+  def test_summarizes_value_series(self):
+    analytics = self.client.get(self.url).json()
+    
+    ## P2 is worth 1000, 1200 and 1700
+    returns = np.array([0.2, 1700 / 1200 - 1])
+    self.assertEqual(analytics["observations"], 3)
+    self.assertAlmostEqual(analytics["total_return"], 0.7)
+    self.assertAlmostEqual(
+      analytics["volatility"], returns.std(ddof=1) * np.sqrt(252))
+    self.assertAlmostEqual(
+      analytics["sharpe_ratio"],
+      returns.mean() * 252 / analytics["volatility"])
+    self.assertEqual(analytics["max_drawdown"], 0.0)
+    self.assertNotIn("rolling", analytics)
+  
+  def test_rolling_window_and_cache(self):
+    url = f"{self.url}?window=3"
+    first = self.client.get(url).json()
+    with self.assertNumQueries(0):
+      second = self.client.get(url).json()
+    
+    rolling = first["rolling"]
+    returns = np.array([0.2, 1700 / 1200 - 1])
+    self.assertEqual(first, second)
+    self.assertEqual(rolling["dates"], ["2022-02-16"])
+    self.assertAlmostEqual(rolling["return"][0], 0.7)
+    self.assertAlmostEqual(
+      rolling["volatility"][0], returns.std(ddof=1) * np.sqrt(252))
+    self.assertEqual(self.client.get(f"{self.url}?window=2").status_code, 400)
+  
+  def test_rejects_missing_series(self):
+    empty = self.client.get(f"{self.url}?from=2030-01-01")
+    unknown = self.client.get("/portfolio/999/analytics")
+    
+    self.assertEqual(empty.status_code, 400)
+    self.assertEqual(unknown.status_code, 404)
+  
+  def test_drawdowns(self):
+    values = pd.Series([100.0, 120.0, 90.0, 60.0, 150.0])
+    
+    analytics = portfolioCalculator.analytics(values.to_numpy())
+    rolling = portfolioCalculator.rolling_analytics(values, 3)
+    
+    self.assertAlmostEqual(analytics["max_drawdown"], -0.5)
+    self.assertTrue(np.isnan(rolling["max_drawdown"][1]))
+    self.assertAlmostEqual(rolling["max_drawdown"][2], -0.25)
+    self.assertAlmostEqual(rolling["max_drawdown"][3], -0.5)
+    self.assertAlmostEqual(rolling["max_drawdown"][4], 60.0 / 90.0 - 1)
+
+
+class CovarianceTest(TestCase):
+  
+  def setUp(self):
+    caches[timeSeriesCache.alias].clear()
+    self.raw_data = SyntheticDataExtractor(4, 3, 30).extract_data()
+  
+  def expected_covariance(self, kind, window):
+    series = covarianceLoader.series_frame(kind, None)
+    returns = series.pct_change().iloc[1:].to_numpy()[-window:]
+    return np.cov(returns, rowvar=False)
+  
+  def test_incremental_update_matches_full_computation(self):
+    entityLoader.populate_db(replace(
+      self.raw_data,
+      prices=self.raw_data.prices.iloc[:20],
+      dates=self.raw_data.dates[:20]))
+    for kind in [ASSET_COVARIANCE, PORTFOLIO_COVARIANCE]:
+      covarianceLoader.update(kind, 10)
+    entityLoader.append(self.raw_data)
+    
+    with mock.patch.object(covarianceLoader, 'compute') as compute:
+      for kind in [ASSET_COVARIANCE, PORTFOLIO_COVARIANCE]:
+        covarianceLoader.update(kind, 10)
+    
+    compute.assert_not_called()
+    for kind, size in [(ASSET_COVARIANCE, 4), (PORTFOLIO_COVARIANCE, 3)]:
+      covariance, ids, matrix = portfolioSelector.covariance_matrix(kind, 10)
+      self.assertEqual(covariance.observations, 10)
+      self.assertEqual(len(ids), size)
+      self.assertEqual(len(covariance.covariance), size * (size + 1) // 2 * 4)
+      np.testing.assert_allclose(
+        matrix, self.expected_covariance(kind, 10), rtol=1e-4)
+  
+  def test_recomputed_history_is_not_slid(self):
+    entityLoader.populate_db(self.raw_data)
+    for kind in [ASSET_COVARIANCE, PORTFOLIO_COVARIANCE]:
+      covarianceLoader.update(kind, 10)
+    
+    entityLoader.apply_transactions([(
+      Portfolio.objects.order_by('name').first(),
+      Asset.objects.order_by('name').first(),
+      self.raw_data.dates[25].date(),
+      1000)])
+    with mock.patch.object(
+        covarianceLoader,
+        'series_frame',
+        wraps=covarianceLoader.series_frame) as series_frame:
+      covarianceLoader.update(PORTFOLIO_COVARIANCE, 10)
+    
+    series_frame.assert_called_once_with(
+      PORTFOLIO_COVARIANCE, self.raw_data.dates[-11].date())
+    _, _, matrix = portfolioSelector.covariance_matrix(PORTFOLIO_COVARIANCE, 10)
+    np.testing.assert_allclose(
+      matrix, self.expected_covariance(PORTFOLIO_COVARIANCE, 10), rtol=1e-4)
+  
+  def test_full_update_command(self):
+    entityLoader.populate_db(self.raw_data)
+    covarianceLoader.update(ASSET_COVARIANCE, 10)
+    
+    with mock.patch.object(covarianceLoader, 'compute') as compute:
+      call_command(
+        'update_covariances', '--kind', 'asset', '--window', '10', '--full')
+    
+    compute.assert_called_once()
+  
+  def test_serves_asset_subsets(self):
+    entityLoader.populate_db(self.raw_data)
+    covarianceLoader.update(ASSET_COVARIANCE, 10)
+    asset_ids = sorted(Asset.objects.values_list('id', flat=True))
+    expected = np.corrcoef(
+      covarianceLoader.series_frame(ASSET_COVARIANCE, None).pct_change()
+      .iloc[-10:].to_numpy(), rowvar=False)
+    
+    response = self.client.get(
+      f"/covariance?window=10&metric=correlation"
+      f"&ids={asset_ids[2]},{asset_ids[0]}").json()
+    
+    matrix = np.array(response["matrix"])
+    self.assertEqual(response["ids"], [asset_ids[2], asset_ids[0]])
+    self.assertEqual(response["observations"], 10)
+    np.testing.assert_allclose(np.diag(matrix), 1.0, rtol=1e-6)
+    np.testing.assert_allclose(matrix[0, 1], expected[2, 0], rtol=1e-4)
+    self.assertEqual(
+      self.client.get("/covariance?window=10&ids=999").status_code, 404)
+    self.assertEqual(
+      self.client.get("/covariance?kind=sector").status_code, 400)
+
+
+class NumericPrecisionTest(TestCase):
+  ## Float mode stores the float64 amounts the calculator computes, so the
+  ## Decimal path has to stay within its sixth decimal of them, up to float64
+  ## rounding on the largest amounts
+  
+  def setUp(self):
+    caches[timeSeriesCache.alias].clear()
+    self.raw_data = SyntheticDataExtractor(6, 3, 20).extract_data()
+    self.computed = portfolioCalculator.compute(self.raw_data)
+    entityLoader.populate_db(self.raw_data)
+  
+  def assert_series_close(self, model, computed, portfolio_asset_index):
+    rows = list(model.objects.values_list(*portfolio_asset_index, 'amount'))
+    dates = {dt_date: i for i, dt_date in enumerate(self.computed.dates)}
+    positions = {
+      name: i for i, name in enumerate(
+        self.computed.portfolios + self.computed.assets)}
+    expected = [
+      computed[(positions[row[0]], dates[row[1]]) + tuple(
+        positions[name] - len(self.computed.portfolios)
+        for name in row[2:-1])]
+      for row in rows]
+    
+    self.assertEqual(len(rows), computed.size)
+    np.testing.assert_allclose(
+      [float(row[-1]) for row in rows], expected, rtol=1e-12, atol=1e-6)
+  
+  def test_stored_series_match_float64(self):
+    self.assert_series_close(
+      Share,
+      self.computed.shares,
+      ['portfolio__name', 'date', 'asset__name'])
+    self.assert_series_close(
+      Weight,
+      self.computed.weights,
+      ['portfolio__name', 'date', 'asset__name'])
+    self.assert_series_close(
+      PortfolioValue,
+      self.computed.values,
+      ['portfolio__name', 'date'])
+  
+  def test_responses_match_float64(self):
+    portfolio = Portfolio.objects.get(name=self.computed.portfolios[0])
+    
+    values = self.client.get(
+      f"/portfolio/{portfolio.id}/value?format=columns").json()["values"]
+    weights = self.client.get(
+      f"/portfolio/{portfolio.id}/weights?format=columns").json()["weights"]
+    
+    np.testing.assert_allclose(
+      values, self.computed.values[0], rtol=1e-12, atol=1e-6)
+    np.testing.assert_allclose(
+      weights, self.computed.weights[0], rtol=1e-12, atol=1e-6)
+  
+  def test_numeric_modes(self):
+    field = Share._meta.get_field("amount")
+    for numeric, field_type, amount in [
+        (DECIMAL_NUMERIC, "DecimalField", Decimal("0.333333")),
+        (FLOAT_NUMERIC, "FloatField", 1 / 3)]:
+      with mock.patch.object(fields, "TIME_SERIES_NUMERIC", numeric):
+        self.assertEqual(field.get_internal_type(), field_type)
+        self.assertEqual(
+          field.db_type(connection), connection.data_types["DecimalField"] % {
+            "max_digits": 40, "decimal_places": 6})
+        self.assertEqual(
+          field.from_db_value(field.to_python(1 / 3), None, connection)
+          if numeric == FLOAT_NUMERIC
+          else field.to_python(1 / 3).quantize(Decimal("0.000001")),
+          amount)
+  
+  def test_float_mode_matches_decimal_path(self):
+    name = self.computed.portfolios[0]
+    decimal_values, decimal_weights = self.series_responses(name)
+    
+    with mock.patch.object(fields, "TIME_SERIES_NUMERIC", FLOAT_NUMERIC):
+      Portfolio.objects.all().delete()
+      Asset.objects.all().delete()
+      entityLoader.populate_db(self.raw_data)
+      caches[timeSeriesCache.alias].clear()
+      float_values, float_weights = self.series_responses(name)
+      stored = list(PortfolioValue.objects.filter(
+        portfolio__name=name).order_by("date").values_list("amount", flat=True))
+    
+    self.assertTrue(all(isinstance(amount, float) for amount in stored))
+    np.testing.assert_allclose(stored, self.computed.values[0], rtol=1e-15)
+    self.assertTrue(all(
+      isinstance(value["amount"], str) for value in decimal_values))
+    self.assertTrue(all(
+      isinstance(value["amount"], float) for value in float_values))
+    np.testing.assert_allclose(
+      [float(value["amount"]) for value in decimal_values],
+      [value["amount"] for value in float_values],
+      rtol=1e-12,
+      atol=1e-6)
+    np.testing.assert_allclose(
+      [list(weights.values())[1:] for weights in decimal_weights],
+      [list(weights.values())[1:] for weights in float_weights],
+      atol=1e-6)
+  
+  def series_responses(self, name):
+    portfolio = Portfolio.objects.get(name=name)
+    values = self.client.get(f"/portfolio/{portfolio.id}/value").json()
+    weights = self.client.get(f"/portfolio/{portfolio.id}/weights").json()
+    return values["values"], weights["weights"]
+
+
+class TimeSeriesCacheTest(TestCase):
+  
+  def setUp(self):
+    caches[timeSeriesCache.alias].clear()
+    entityLoader.populate_db(build_raw_data())
+    self.portfolio = Portfolio.objects.get(name="P1")
+    self.url = f"/portfolio/{self.portfolio.id}/weights?from=2022-02-14"
+  
+  def test_repeated_requests_hit_cache(self):
+    first = self.client.get(self.url).json()
+    with self.assertNumQueries(0):
+      second = self.client.get(self.url).json()
+    
+    self.assertEqual(first, second)
+    self.assertEqual(len(first["weights"]), 3)
+  
+  def test_bulk_writes_invalidate_cache(self):
+    self.client.get(self.url)
+    
+    with self.captureOnCommitCallbacks(execute=True):
+      portfolioService.portfolios_bulk_create(["P3"])
+    
+    with CaptureQueriesContext(connection) as queries:
+      self.client.get(self.url)
+    self.assertTrue(queries.captured_queries)
   
-  def test_fetch_marketInformationService(self):
-    pass
+  def test_other_processes_invalidate_cache(self):
+    self.client.get(self.url)
+    
+    with ProcessPoolExecutor(max_workers=1) as executor:
+      executor.submit(timeSeriesCache.invalidate).result()
+    
+    with CaptureQueriesContext(connection) as queries:
+      self.client.get(self.url)
+    self.assertTrue(queries.captured_queries)
 
 
 if __name__ == "__main__":
-  print("hola")
\ No newline at end of file
+  unittest.main()
@@ -1,10 +1,28 @@
 from django.urls import path
 from portfolioviz import views  
+from portfolioviz.settings import ASYNC_VIEWS
 
 urlpatterns = [
     path('ping/', views.pong), # checks server is up =)
-    path('portfolios/', views.get_portfolios),
-    path('assets/', views.get_assets),
-    path('portfolio/<str:portfolio_id>/value', views.get_portfolio_value),
-    path('portfolio/<str:portfolio_id>/weights', views.get_weights),
+    path('portfolios/series', views.get_portfolio_series),
+    path('portfolios/simulate', views.simulate_rebalance),
+    path('covariance', views.get_covariance),
+    path('portfolio/<str:portfolio_id>/analytics',
+        views.get_portfolio_analytics),
 ]
+
+if ASYNC_VIEWS:
+    urlpatterns += [
+        path('portfolios/', views.get_portfolios_async),
+        path('assets/', views.get_assets_async),
+        path('portfolio/<str:portfolio_id>/value',
+            views.get_portfolio_value_async),
+        path('portfolio/<str:portfolio_id>/weights', views.get_weights_async),
+    ]
+else:
+    urlpatterns += [
+        path('portfolios/', views.get_portfolios),
+        path('assets/', views.get_assets),
+        path('portfolio/<str:portfolio_id>/value', views.get_portfolio_value),
+        path('portfolio/<str:portfolio_id>/weights', views.get_weights),
+    ]
@@ -1,5 +1,12 @@
+from argparse import ArgumentTypeError
+import numpy as np
+import orjson
+from django.http import HttpResponse, HttpResponseNotAllowed
 from portfolioviz.exceptions import BadDateFormatException
-from typing import Iterable
+from functools import wraps
+from itertools import islice
+from typing import Iterable, Iterator, List
+from portfolioviz.constants import INITIAL_DATE
 from portfolioviz.settings import DATE_FORMAT
 from datetime import date
 from datetime import datetime
@@ -12,12 +19,74 @@ def parse_request_date(str_date: str) -> date:
         raise BadDateFormatException(f"Invalid value: {str_date}",
             params={"date": str_date})
 
+def date_range(date_from: date, date_to: date) -> List[date]:
+    return [
+        date_from if date_from is not None else INITIAL_DATE,
+        date_to if date_to is not None else date.today()
+    ]
+
 def parse_query_param(request, key) -> str:
     return request.GET.get(key, None)
 
 def to_dict_mapper(iterable: Iterable):
     return list(map(lambda x: x.to_dict(), iterable))
 
+def json_dumps(payload) -> bytes:
+    ## Decimals as strings, like DjangoJSONEncoder; NaN becomes null
+    return orjson.dumps(
+        payload, default=json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+def json_default(value):
+    ## orjson only serializes C-contiguous arrays natively
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+def json_response(body: bytes, status: int = 200) -> HttpResponse:
+    return HttpResponse(body, content_type="application/json", status=status)
+
+def async_require_http_methods(request_method_list):
+    ## django.views.decorators.http only wraps sync views before Django 5.0
+    def decorator(func):
+        @wraps(func)
+        async def inner(request, *args, **kwargs):
+            if request.method not in request_method_list:
+                return HttpResponseNotAllowed(request_method_list)
+            return await func(request, *args, **kwargs)
+        return inner
+    return decorator
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise ArgumentTypeError(f"Expected a positive integer, got {value}")
+    return number
+
+def batched(iterable: Iterable, batch_size: int) -> Iterator[List]:
+    if batch_size < 1:
+        raise ValueError(f"Invalid batch size: {batch_size}")
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+def pack_array(values, dtype: str = '<f8') -> bytes:
+    return np.asarray(values, dtype=dtype).tobytes()
+
+def unpack_array(blob: bytes, dtype: str = '<f8') -> np.ndarray:
+    return np.frombuffer(blob, dtype=dtype)
+
+def pack_upper_triangle(matrix: np.ndarray, dtype: str = '<f8') -> bytes:
+    ## Row by row, diagonal included
+    return pack_array(matrix[np.triu_indices(len(matrix))], dtype)
+
+def upper_triangle_take(
+        packed: np.ndarray, size: int, positions: np.ndarray) -> np.ndarray:
+    ## The symmetric submatrix over positions of a packed size x size matrix
+    rows, columns = np.meshgrid(positions, positions, indexing='ij')
+    low = np.minimum(rows, columns)
+    high = np.maximum(rows, columns)
+    return packed[low * size - low * (low - 1) // 2 + high - low]
+
 
 class Singleton(type):
     _instances = {}
@@ -1,15 +1,49 @@
+import orjson
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.core.exceptions import BadRequest
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.http import Http404, HttpResponseBadRequest
 from rest_framework.views import exception_handler
 from rest_framework import exceptions
+from portfolioviz.cache import timeSeriesCache
+from portfolioviz.constants import (
+    COLUMNS_RESPONSE_FORMAT,
+    COVARIANCE_KINDS,
+    COVARIANCE_METRIC,
+    COVARIANCE_METRICS,
+    COVARIANCE_WINDOW,
+    DAILY_RESOLUTION,
+    INITIAL_VALUE,
+    NDJSON_STREAM,
+    RESPONSE_FORMATS,
+    ROLLUP_FREQUENCIES,
+    ROWS_RESPONSE_FORMAT,
+    SERIES_METRICS,
+    STREAM_FORMATS,
+    STREAM_RESPONSE_ROWS,
+    VALUE_METRIC,
+    WEIGHTS_METRIC,
+    WEIGHTS_SUM_TOLERANCE
+)
 from portfolioviz.selectors import (
     marketSelector,
     portfolioSelector
 )
+from portfolioviz.services import portfolioCalculator
 from portfolioviz.exceptions import BadDateFormatException
-from portfolioviz.utils import parse_request_date, parse_query_param, to_dict_mapper
+from portfolioviz.fields import stores_floats
+from portfolioviz.settings import DATE_FORMAT
+from portfolioviz.utils import (
+    async_require_http_methods,
+    batched,
+    json_dumps,
+    json_response,
+    parse_request_date,
+    parse_query_param
+)
 
 @require_http_methods(["GET"])
 def pong(request):
@@ -18,52 +52,452 @@ def pong(request):
 @require_http_methods(["GET"])
 @csrf_exempt
 def get_assets(request):
-    assets = marketSelector.assets_list()
-    return JsonResponse({
-        "instances": to_dict_mapper(assets)}, status=200)
+    assets = marketSelector.assets_list().values('id', 'name')
+    return json_response(json_dumps({"instances": list(assets)}))
+
+@async_require_http_methods(["GET"])
+async def get_assets_async(request):
+    assets = [
+        asset async for asset in marketSelector.assets_list().values(
+            'id', 'name')]
+    return json_response(json_dumps({"instances": assets}))
 
 @require_http_methods(["GET"])
 @csrf_exempt
 def get_portfolios(request):
-    portfolios = portfolioSelector.portfolios_list()
-    return JsonResponse({
-        "instances": to_dict_mapper(portfolios)}, status=200)
+    portfolios = portfolioSelector.portfolios_list().values('id', 'name')
+    return json_response(json_dumps({"instances": list(portfolios)}))
+
+@async_require_http_methods(["GET"])
+async def get_portfolios_async(request):
+    portfolios = [
+        portfolio async for portfolio in portfolioSelector.portfolios_list(
+            ).values('id', 'name')]
+    return json_response(json_dumps({"instances": portfolios}))
 
 @require_http_methods(["GET"])
 @csrf_exempt
 def get_portfolio_value(request, portfolio_id):
-    values = portfolioSelector.portfolio_value_list(
+    params = time_series_params(request)
+    stream = stream_param(request, params)
+    if stream is not None:
+        return portfolio_value_streaming_response(portfolio_id, stream, *params)
+    return json_response(portfolio_value_body(portfolio_id, *params))
+
+@async_require_http_methods(["GET"])
+async def get_portfolio_value_async(request, portfolio_id):
+    reject_async_stream(request)
+    ## Selectors and the cache stay synchronous; they run in a worker thread
+    body = await sync_to_async(portfolio_value_body)(
+        portfolio_id, *time_series_params(request))
+    return json_response(body)
+
+def time_series_params(request):
+    date_from = parse_request_date(parse_query_param(request, 'from'))
+    date_to = parse_request_date(parse_query_param(request, 'to'))
+    resolution = parse_query_param(request, 'resolution') or DAILY_RESOLUTION
+    response_format = (
+        parse_query_param(request, 'format') or ROWS_RESPONSE_FORMAT)
+    if not is_valid_resolution(resolution):
+        raise BadRequest(f"Invalid resolution: {resolution}")
+    if response_format not in RESPONSE_FORMATS:
+        raise BadRequest(f"Invalid format: {response_format}")
+    return date_from, date_to, resolution, response_format
+
+def stream_param(request, params):
+    stream = parse_query_param(request, 'stream')
+    if stream is None:
+        return None
+    if stream not in STREAM_FORMATS:
+        raise BadRequest(f"Invalid stream: {stream}")
+    if params[3] != ROWS_RESPONSE_FORMAT:
+        raise BadRequest("Only the rows format can be streamed")
+    return stream
+
+def reject_async_stream(request):
+    ## Django 4.1 iterates streaming content inside the event loop, where the
+    ## lazy querysets behind it cannot run
+    if parse_query_param(request, 'stream') is not None:
+        raise BadRequest("Streaming responses are served by the sync views")
+
+def streaming_json_response(payload, key, rows, stream):
+    ## Rows are encoded a batch at a time as the queryset is read, so memory
+    ## stays flat however long the history is
+    batches = batched(rows, STREAM_RESPONSE_ROWS)
+    if stream == NDJSON_STREAM:
+        return StreamingHttpResponse(
+            (b"".join(json_dumps(row) + b"\n" for row in batch)
+             for batch in batches),
+            content_type="application/x-ndjson")
+    return StreamingHttpResponse(
+        json_array_chunks(payload, key, batches),
+        content_type="application/json")
+
+def json_array_chunks(payload, key, batches):
+    yield json_dumps(payload)[:-1] + b"," + json_dumps(key) + b":["
+    separator = b""
+    for batch in batches:
+        yield separator + b",".join(map(json_dumps, batch))
+        separator = b","
+    yield b"]}"
+
+def portfolio_value_streaming_response(
+        portfolio_id, stream, date_from, date_to, resolution, response_format):
+    values = portfolioSelector.portfolio_value_stream(
         portfolio_id=portfolio_id,
-        date_from=parse_request_date(
-            parse_query_param(request, 'from')),
-        date_to=parse_request_date(
-            parse_query_param(request, 'to')))
-    return JsonResponse({
-        "portfolio_id": portfolio_id,
-        "values": to_dict_mapper(list(values))}, status=200)
+        date_from=date_from,
+        date_to=date_to,
+        resolution=resolution)
+    return streaming_json_response(
+        {"portfolio_id": portfolio_id, "resolution": resolution},
+        "values",
+        (
+            {
+                **{
+                    column: value_amount(amount)
+                    for column, amount in amounts.items()},
+                "date": dt_date.strftime(DATE_FORMAT)}
+            for dt_date, amounts in values),
+        stream)
+
+def portfolio_value_body(
+        portfolio_id, date_from, date_to, resolution, response_format):
+    return timeSeriesCache.get_or_compute(
+        f'value:{resolution}:{response_format}',
+        portfolio_id,
+        date_from,
+        date_to,
+        lambda: json_dumps({
+            "portfolio_id": portfolio_id,
+            "resolution": resolution,
+            **portfolio_value_response(
+                portfolio_id, date_from, date_to, resolution, response_format)}))
+
+def portfolio_value_response(
+        portfolio_id,
+        date_from,
+        date_to,
+        resolution=DAILY_RESOLUTION,
+        response_format=ROWS_RESPONSE_FORMAT):
+    values = portfolioSelector.portfolio_value_frame(
+        portfolio_id=portfolio_id,
+        date_from=date_from,
+        date_to=date_to,
+        resolution=resolution)
+    return value_payload(values, response_format)
+
+def value_payload(values, response_format):
+    dates = [dt_date.strftime(DATE_FORMAT) for dt_date in values.index]
+    if response_format == COLUMNS_RESPONSE_FORMAT:
+        return {
+            "dates": dates,
+            "values": values['amount'].to_numpy(),
+            **{
+                column: values[column].to_numpy()
+                for column in values.columns.drop('amount')}}
+    return {"values": [
+        {
+            **{
+                column: value_amount(amount)
+                for column, amount in zip(values.columns, row)},
+            "date": date_str}
+        for date_str, row in zip(dates, values.to_numpy().tolist())]}
+
+def value_amount(amount):
+    ## Decimal mode keeps the six stored decimals as a string. Rollups,
+    ## snapshots and derived shares stay Decimal in float mode as well
+    if stores_floats():
+        return float(amount)
+    return f"{amount:.6f}"
 
 @require_http_methods(["GET"])
 @csrf_exempt
 def get_weights(request, portfolio_id):
-    weights = portfolioSelector.weight_list(
+    params = time_series_params(request)
+    stream = stream_param(request, params)
+    if stream is not None:
+        return weight_streaming_response(portfolio_id, stream, *params)
+    return json_response(weight_body(portfolio_id, *params))
+
+@async_require_http_methods(["GET"])
+async def get_weights_async(request, portfolio_id):
+    reject_async_stream(request)
+    body = await sync_to_async(weight_body)(
+        portfolio_id, *time_series_params(request))
+    return json_response(body)
+
+def weight_streaming_response(
+        portfolio_id, stream, date_from, date_to, resolution, response_format):
+    weights = portfolioSelector.weight_stream(
+        portfolio_id=portfolio_id,
+        date_from=date_from,
+        date_to=date_to,
+        resolution=resolution)
+    return streaming_json_response(
+        {"portfolio_id": portfolio_id, "resolution": resolution},
+        "weights",
+        (
+            {
+                "date": dt_date.strftime(DATE_FORMAT),
+                **{
+                    asset_name: float(amount)
+                    for asset_name, amount in amounts.items()}}
+            for dt_date, amounts in weights),
+        stream)
+
+def weight_body(
+        portfolio_id, date_from, date_to, resolution, response_format):
+    return timeSeriesCache.get_or_compute(
+        f'weights:{resolution}:{response_format}',
+        portfolio_id,
+        date_from,
+        date_to,
+        lambda: json_dumps({
+            "portfolio_id": portfolio_id,
+            "resolution": resolution,
+            **weight_response(
+                portfolio_id, date_from, date_to, resolution, response_format)}))
+
+def weight_response(
+        portfolio_id,
+        date_from,
+        date_to,
+        resolution=DAILY_RESOLUTION,
+        response_format=ROWS_RESPONSE_FORMAT):
+    weights = portfolioSelector.weight_frame(
         portfolio_id=portfolio_id,
-        date_from=parse_request_date(
-            parse_query_param(request, 'from')),
-        date_to=parse_request_date(
-            parse_query_param(request, 'to')))
-    weight_response_list = to_dict_mapper(weights)
-    
-    by_date_grouping = {}
-    for weight_response in weight_response_list:
-        date_str = weight_response["date"]
-        if date_str not in by_date_grouping:
-            by_date_grouping[date_str] = {"date": date_str}
-        by_date_grouping[date_str][
-        weight_response["asset_name"]] = float(weight_response["amount"])
-    
-    return JsonResponse({
-        "portfolio_id": portfolio_id,
-        "weights": list(by_date_grouping.values())}, status=200)
+        date_from=date_from,
+        date_to=date_to,
+        resolution=resolution)
+    return weight_payload(weights, response_format)
+
+def weight_payload(weights, response_format):
+    dates = [dt_date.strftime(DATE_FORMAT) for dt_date in weights.index]
+    if response_format == COLUMNS_RESPONSE_FORMAT:
+        return {
+            "dates": dates,
+            "assets": weights.columns.tolist(),
+            "weights": weights.to_numpy()}
+    ## Assets without a weight on a date are left out of its row
+    return {"weights": [
+        {
+            "date": date_str,
+            **{
+                asset_name: amount
+                for asset_name, amount in zip(weights.columns, row)
+                if amount == amount}}
+        for date_str, row in zip(dates, weights.to_numpy().tolist())]}
+
+@require_http_methods(["GET"])
+@csrf_exempt
+def get_portfolio_series(request):
+    portfolio_ids = (parse_query_param(request, 'ids') or '').split(',')
+    metrics = (
+        parse_query_param(request, 'metrics') or ','.join(SERIES_METRICS)
+    ).split(',')
+    date_from, date_to, resolution, response_format = time_series_params(
+        request)
+    if not all(portfolio_id.isdigit() for portfolio_id in portfolio_ids):
+        raise BadRequest(f"Invalid ids: {portfolio_ids}")
+    if not set(metrics) <= set(SERIES_METRICS):
+        raise BadRequest(f"Invalid metrics: {metrics}")
+    portfolio_ids = list(dict.fromkeys(map(int, portfolio_ids)))
+    body = timeSeriesCache.get_or_compute(
+        f"series:{','.join(metrics)}:{resolution}:{response_format}",
+        ','.join(map(str, portfolio_ids)),
+        date_from,
+        date_to,
+        lambda: json_dumps({
+            "resolution": resolution,
+            "portfolios": portfolio_series_response(
+                portfolio_ids,
+                metrics,
+                date_from,
+                date_to,
+                resolution,
+                response_format)}))
+    return json_response(body)
+
+def portfolio_series_response(
+        portfolio_ids,
+        metrics,
+        date_from,
+        date_to,
+        resolution=DAILY_RESOLUTION,
+        response_format=ROWS_RESPONSE_FORMAT):
+    series = {
+        portfolio.id: {"portfolio_id": portfolio.id, "name": portfolio.name}
+        for portfolio in portfolioSelector.portfolios_get(portfolio_ids)}
+    if VALUE_METRIC in metrics:
+        values = portfolioSelector.portfolio_value_frames(
+            portfolio_ids, date_from, date_to, resolution)
+        for portfolio_id, payload in series.items():
+            payload.update(
+                value_payload(values[portfolio_id], response_format))
+    if WEIGHTS_METRIC in metrics:
+        weights = portfolioSelector.weight_frames(
+            portfolio_ids, date_from, date_to, resolution)
+        for portfolio_id, payload in series.items():
+            payload.update(
+                weight_payload(weights[portfolio_id], response_format))
+    return list(series.values())
+
+@require_http_methods(["GET"])
+@csrf_exempt
+def get_portfolio_analytics(request, portfolio_id):
+    date_from = parse_request_date(parse_query_param(request, 'from'))
+    date_to = parse_request_date(parse_query_param(request, 'to'))
+    window, risk_free_rate = analytics_params(request)
+    body = timeSeriesCache.get_or_compute(
+        f'analytics:{window}:{risk_free_rate}',
+        portfolio_id,
+        date_from,
+        date_to,
+        lambda: json_dumps({
+            "portfolio_id": portfolio_id,
+            **portfolio_analytics_response(
+                portfolio_id, date_from, date_to, window, risk_free_rate)}))
+    return json_response(body)
+
+def analytics_params(request):
+    window = parse_query_param(request, 'window')
+    risk_free_rate = parse_query_param(request, 'risk_free_rate') or '0'
+    ## Volatility and Sharpe ratio need at least two returns per window
+    if window is not None and (not window.isdigit() or int(window) < 3):
+        raise BadRequest(f"Invalid window: {window}")
+    try:
+        risk_free_rate = float(risk_free_rate)
+    except ValueError:
+        raise BadRequest(f"Invalid risk free rate: {risk_free_rate}")
+    return window and int(window), risk_free_rate
+
+def portfolio_analytics_response(
+        portfolio_id, date_from, date_to, window=None, risk_free_rate=0.0):
+    values = portfolioSelector.portfolio_value_frame(
+        portfolio_id=portfolio_id,
+        date_from=date_from,
+        date_to=date_to)['amount']
+    if values.empty:
+        portfolioSelector.portfolio_get(id=portfolio_id)
+        raise BadRequest("No portfolio values in the date range")
+    response = {
+        "risk_free_rate": risk_free_rate,
+        **portfolioCalculator.analytics(values.to_numpy(), risk_free_rate)}
+    if window is not None:
+        rolling = portfolioCalculator.rolling_analytics(
+            values, window, risk_free_rate).iloc[window - 1:]
+        response["rolling"] = {
+            "window": window,
+            "dates": [
+                dt_date.strftime(DATE_FORMAT) for dt_date in rolling.index],
+            **{
+                column: rolling[column].to_numpy()
+                for column in rolling.columns}}
+    return response
+
+@require_http_methods(["GET"])
+@csrf_exempt
+def get_covariance(request):
+    kind = parse_query_param(request, 'kind') or COVARIANCE_KINDS[0]
+    window = parse_query_param(request, 'window') or str(COVARIANCE_WINDOW)
+    metric = parse_query_param(request, 'metric') or COVARIANCE_METRIC
+    ids = parse_query_param(request, 'ids')
+    if kind not in COVARIANCE_KINDS:
+        raise BadRequest(f"Invalid kind: {kind}")
+    if not window.isdigit():
+        raise BadRequest(f"Invalid window: {window}")
+    if metric not in COVARIANCE_METRICS:
+        raise BadRequest(f"Invalid metric: {metric}")
+    if ids is not None and not all(
+            series_id.isdigit() for series_id in ids.split(',')):
+        raise BadRequest(f"Invalid ids: {ids}")
+    body = timeSeriesCache.get_or_compute(
+        f'{metric}:{kind}:{window}',
+        ids or 'all',
+        None,
+        None,
+        lambda: json_dumps(covariance_response(
+            kind,
+            int(window),
+            ids and [int(series_id) for series_id in ids.split(',')],
+            metric)))
+    return json_response(body)
+
+def covariance_response(kind, window, ids, metric):
+    covariance, ids, matrix = portfolioSelector.covariance_matrix(
+        kind, window, ids, metric)
+    return {
+        "kind": kind,
+        "window": window,
+        "metric": metric,
+        "date": covariance.date.strftime(DATE_FORMAT),
+        "observations": covariance.observations,
+        "ids": ids,
+        "matrix": matrix}
+
+@require_http_methods(["POST"])
+@csrf_exempt
+def simulate_rebalance(request):
+    initial_weights, initial_value, date_from, date_to, response_format = (
+        simulation_params(request))
+    prices = marketSelector.price_frame(date_from, date_to)
+    if prices.empty:
+        raise BadRequest("No prices in the date range")
+    unknown_assets = initial_weights.index.difference(prices.columns)
+    if not unknown_assets.empty:
+        raise BadRequest(f"Unknown assets: {unknown_assets.tolist()}")
+    computed = portfolioCalculator.simulate(
+        prices[initial_weights.index], initial_weights, initial_value)
+    return json_response(json_dumps({
+        "initial_value": initial_value,
+        "portfolios": simulation_response(computed, response_format)}))
+
+def simulation_params(request):
+    ## weights has the rows of the weights sheet: the asset under activos
+    ## and one column per candidate portfolio, Fecha is ignored
+    try:
+        payload = orjson.loads(request.body)
+        initial_weights = pd.DataFrame(payload["weights"]).drop(
+            columns="Fecha", errors="ignore").set_index("activos")
+        initial_weights = initial_weights.fillna(0).astype(float)
+        initial_value = float(payload.get("initial_value", INITIAL_VALUE))
+        date_from = parse_request_date(payload.get("from"))
+        date_to = parse_request_date(payload.get("to"))
+        response_format = payload.get("format", ROWS_RESPONSE_FORMAT)
+    except (orjson.JSONDecodeError, AttributeError, KeyError, TypeError,
+            ValueError, BadDateFormatException) as error:
+        raise BadRequest(f"Invalid simulation: {error}")
+    if initial_weights.empty or not initial_weights.index.is_unique:
+        raise BadRequest("Expected one row of weights per asset")
+    if (initial_weights < 0).any(axis=None):
+        raise BadRequest("Weights have to be non-negative")
+    unbalanced = initial_weights.columns[
+        (initial_weights.sum() - 1).abs() > WEIGHTS_SUM_TOLERANCE]
+    if not unbalanced.empty:
+        raise BadRequest(
+            f"Weights have to sum to 1 in portfolios {unbalanced.tolist()}")
+    if initial_value <= 0:
+        raise BadRequest(f"Invalid initial value: {initial_value}")
+    if response_format not in RESPONSE_FORMATS:
+        raise BadRequest(f"Invalid format: {response_format}")
+    return initial_weights, initial_value, date_from, date_to, response_format
+
+def simulation_response(computed, response_format):
+    return [
+        {
+            "name": name,
+            **value_payload(
+                pd.DataFrame({"amount": values}, index=computed.dates),
+                response_format),
+            **weight_payload(
+                pd.DataFrame(
+                    weights, index=computed.dates, columns=computed.assets),
+                response_format)}
+        for name, values, weights in zip(
+            computed.portfolios, computed.values, computed.weights)]
+
+def is_valid_resolution(resolution):
+    return resolution == DAILY_RESOLUTION or resolution in ROLLUP_FREQUENCIES
 
 
 def portfolioviz_exception_handler(exc, ctx):